@@ -0,0 +1,185 @@
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+import plot
+from data_preprocessor import get_values
+from generate_results import generate_results
+from output_paths import RENDERER_FORMATS
+from profiler import profiler
+from results_cache import results_cache
+
+# The plot types each renderer supports. "group" is a group of line plots (one per series)
+RENDERER_TYPES = {
+    "bokeh": ["line", "scatter", "histogram", "heatmap", "group"],
+    "matplotlib": ["line", "scatter", "histogram", "heatmap", "group"],
+}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the plotting pipeline on synthetic results files')
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help='(Optional) The numbers of points per series to benchmark with')
+    parser.add_argument("--series", type=int, default=4,
+                        help='(Optional) The number of series in the results file (and per plot)')
+    parser.add_argument("--depth", type=int, default=2,
+                        help='(Optional) The number of nested objects the series are in')
+    parser.add_argument("--max-heatmap-points", type=int, default=100000,
+                        help='(Optional) The maximum number of cells in the heatmaps')
+    parser.add_argument("--renderers", nargs="+", default=list(RENDERER_TYPES), choices=list(RENDERER_TYPES),
+                        help='(Optional) The renderers to benchmark')
+    parser.add_argument("--types", nargs="+", default=RENDERER_TYPES["bokeh"],
+                        help='(Optional) The plot types to benchmark ("group" for a group of line plots)')
+    parser.add_argument("--formats", nargs="+", default=["html", "png"],
+                        help='(Optional) The output formats to benchmark (if supported by the renderer)')
+    parser.add_argument("--repeat", type=int, default=3,
+                        help='(Optional) The number of times to run each scenario (the fastest run is reported)')
+    parser.add_argument("--work-dir", default=None,
+                        help='(Optional) The directory for the results files and plots (default: a temporary one)')
+    parser.add_argument("-o", "--output", default="bench_results.json",
+                        help='(Optional) The file to save the benchmark results to')
+    parser.add_argument("--compare", default=None,
+                        help='(Optional) A previous benchmark results file to compare against')
+    return parser.parse_args()
+
+
+def get_configs(results_file, prefix, plot_type, renderer, output_format, series):
+    columns = [f"{prefix}.columns.series_{i}" for i in range(series)]
+    base = {
+        "results_file": results_file,
+        "output_path": f"{renderer}_{output_format}",
+        "output_file": plot_type,
+        "plot": {"title": plot_type, "renderer": renderer, "type": plot_type, "output_format": [output_format]},
+    }
+    if plot_type == "heatmap":
+        config = copy.deepcopy(base)
+        config["x_axis"] = {"values": [{"param": f"{prefix}.heatmap.x"}]}
+        config["y_axis"] = {"values": [{"param": f"{prefix}.heatmap.y", "labels": f"{prefix}.heatmap.value"}]}
+        return [config]
+    if plot_type == "histogram":
+        config = copy.deepcopy(base)
+        config["x_axis"] = {"values": []}
+        config["y_axis"] = {"values": [{"param": f"{column}.value"} for column in columns]}
+        return [config]
+    if plot_type == "group":
+        configs = []
+        for i, column in enumerate(columns):
+            config = copy.deepcopy(base)
+            config["plot"].update({"title": f"series_{i}", "type": "line", "group": "group"})
+            config["x_axis"] = {"values": [{"param": f"{column}.timeStamp"}]}
+            config["y_axis"] = {"values": [{"param": f"{column}.value"}]}
+            configs.append(config)
+        return configs
+    config = copy.deepcopy(base)
+    config["x_axis"] = {"values": [{"param": f"{column}.timeStamp"} for column in columns]}
+    config["y_axis"] = {"values": [{"param": f"{column}.value"} for column in columns]}
+    return [config]
+
+
+# Plot the configs from scratch (the results file is parsed again), and get the wall time and the time per stage
+def run_scenario(configs, work_dir):
+    results_cache.clear()
+    profiler.take_records()
+    # New renderers for every run, so that nothing (e.g. the plots of a failed group) is left over from the last one
+    bkh = plot.LazyRenderer("bokeh_wrapper", "Bokeh", work_dir)
+    mpl = plot.LazyRenderer("matplotlib_wrapper", "Matplotlib", work_dir)
+    start = time.perf_counter()
+    for config in copy.deepcopy(configs):
+        if plot.check_config(config) == -1:
+            raise ValueError(f"Invalid config {config['plot']['title']}")
+        values = get_values(config, work_dir)
+        plot.render(config, values, bkh, mpl)
+    bkh.write_group_plots()
+    mpl.write_group_plots()
+    seconds = time.perf_counter() - start
+
+    stages = {}
+    for record in profiler.take_records():
+        stages[record["stage"]] = stages.get(record["stage"], 0) + record["seconds"]
+    return seconds, stages
+
+
+def get_key(result):
+    return result["renderer"], result["type"], result["format"], result["points"]
+
+
+def compare(results, previous_file):
+    with open(previous_file, "r") as f:
+        previous = {get_key(result): result for result in json.load(f)["results"] if "seconds" in result}
+    print(f"\nCompared to {previous_file} (> 1 is faster now):")
+    for result in results:
+        if "seconds" not in result or get_key(result) not in previous:
+            continue
+        speedup = previous[get_key(result)]["seconds"] / result["seconds"]
+        print(f"  {' '.join(str(field) for field in get_key(result))}: {previous[get_key(result)]['seconds']:.3f} s "
+              f"-> {result['seconds']:.3f} s ({speedup:.2f}x)")
+
+
+def main():
+    args = parse_arguments()
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix="plot_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    plot.root_dir = work_dir
+    profiler.enabled = True
+
+    # Imported here, so that their import time is not part of the first scenario
+    for renderer in args.renderers:
+        plot.timed_import(f"{renderer}_wrapper")
+
+    results = []
+    for points in args.points:
+        results_file = os.path.join(work_dir, f"results_{points}.json")
+        prefix = generate_results(results_file, args.depth, args.series, points,
+                                  heatmap_points=min(points, args.max_heatmap_points))
+        print(f"\nGenerated {results_file} ({os.path.getsize(results_file) / (1024 * 1024):.1f} MB)")
+
+        for renderer in args.renderers:
+            for plot_type in args.types:
+                for output_format in args.formats:
+                    if plot_type not in RENDERER_TYPES[renderer] or output_format not in RENDERER_FORMATS[renderer]:
+                        continue
+                    result = {"renderer": renderer, "type": plot_type, "format": output_format, "points": points,
+                              "series": args.series, "depth": args.depth}
+                    configs = get_configs(results_file, prefix, plot_type, renderer, output_format, args.series)
+                    try:
+                        runs = []
+                        for _ in range(args.repeat):
+                            with warnings.catch_warnings():
+                                warnings.simplefilter("ignore")
+                                runs.append(run_scenario(configs, work_dir))
+                    except Exception as e:
+                        warnings.warn(f"Scenario {renderer} {plot_type} {output_format} with {points} points failed "
+                                      f"({e})")
+                        result["error"] = str(e)
+                        results.append(result)
+                        continue
+                    seconds, stages = min(runs, key=lambda run: run[0])
+                    result.update({"seconds": seconds, "runs": [run[0] for run in runs], "stages": stages})
+                    results.append(result)
+                    print(f"{renderer} {plot_type} {output_format} with {points} points: {seconds:.3f} s "
+                          f"({', '.join(f'{stage} {stage_seconds:.3f} s' for stage, stage_seconds in stages.items())})")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "args": vars(args),
+            "results": results
+        }, f, indent=2)
+    print(f"\nBenchmark results saved to {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
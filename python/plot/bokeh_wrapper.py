@@ -1,18 +1,28 @@
-import numbers
+import hashlib
+import json
 import os
+import queue
+import threading
+import time
 import warnings
+from string import Template
 
 import numpy as np
-import pandas as pd
 import progressbar
-from bokeh.embed import file_html
+from bokeh.colors import named
+from bokeh.embed import file_html, json_item
 from bokeh.io import export_png, export_svg
 from bokeh.layouts import gridplot, column
 from bokeh.models import Whisker, NumeralTickFormatter, Range1d, ColumnDataSource, PanTool, TapTool, \
-    WheelZoomTool, BoxZoomTool, SaveTool, HoverTool, ResetTool, LinearAxis, LabelSet, Div
+    WheelZoomTool, BoxZoomTool, SaveTool, HoverTool, ResetTool, LinearAxis, LabelSet, Div, LinearColorMapper
 from bokeh.plotting import figure
 from bokeh.resources import CDN
 
+from data_preprocessor import get_density, get_density_rgba, get_heatmap_values, get_heatmap_cells, \
+    get_heatmap_limits, get_axis_limits, HEATMAP_PALETTE
+from output_paths import get_output_file_name, get_output_files, get_output_file, BOKEH_FORMATS
+from profiler import profiler
+
 colors = {
     "red": "#e60049",
     "purple": "#9b19f5",
@@ -27,8 +37,137 @@ colors = {
 color_list = list(colors)
 
 
+# The index page of a dashboard. Every plot is a placeholder, and is only embedded once it is scrolled into view, by
+# loading its script (which calls loadDashboardPlot with the plot's document JSON)
+# Scripts are used rather than fetching JSON files, as fetch() is not allowed for pages opened from the file system
+DASHBOARD_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+$resources
+<style>
+  .dashboard { display: grid; grid-template-columns: repeat($columns, max-content); gap: 10px; }
+</style>
+</head>
+<body>
+<div class="dashboard">
+$plots
+</div>
+<script>
+  window.loadDashboardPlot = function (id, item) {
+    Bokeh.embed.embed_item(item, id);
+  };
+  const observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (!entry.isIntersecting) {
+        return;
+      }
+      observer.unobserve(entry.target);
+      const script = document.createElement("script");
+      script.src = entry.target.dataset.src;
+      document.body.appendChild(script);
+    });
+  }, {rootMargin: "200px"});
+  document.querySelectorAll(".dashboard > div").forEach(function (div) {
+    observer.observe(div);
+  });
+</script>
+</body>
+</html>
+""")
+
+
+# The sources of a document (a plot, or all the plots of a group). Data with the same values in the columns it has in
+# common with a source (e.g. the x and y of a scatter plot, and the x, y and error bounds of a line plot of the same
+# series) is the same rows, so it gets that source, with its other columns added to it. Every column is then written to
+# the HTML only once. Numpy columns are written as binary buffers of their dtype (float32 with "dtype": "float32")
+class SharedSources:
+    def __init__(self):
+        self.sources = []  # (source, {column name: column key})
+
+    @staticmethod
+    def get_column_key(column):
+        column = np.asarray(column)
+        if column.dtype.kind == "O":
+            column = column.astype(str)
+        return column.dtype.str, column.shape, hashlib.blake2b(np.ascontiguousarray(column), digest_size=16).digest()
+
+    def get(self, data):
+        keys = {name: self.get_column_key(column) for name, column in data.items()}
+        for source, source_keys in self.sources:
+            common = keys.keys() & source_keys.keys()
+            if len(common) > 0 and all(keys[name] == source_keys[name] for name in common):
+                for name in keys.keys() - common:
+                    source.data[name] = data[name]
+                    source_keys[name] = keys[name]
+                return source
+        source = ColumnDataSource(data=data)
+        self.sources.append((source, keys))
+        return source
+
+
+# Headless browsers for static (png/svg) exports, shared by all the exports instead of paying the browser startup per
+# export. Browsers are started lazily, up to size of them (one per concurrent export)
+class WebdriverPool:
+    def __init__(self, size=1):
+        self.size = max(size, 1)
+        self.drivers = []
+        self.available = queue.Queue()
+        self.lock = threading.Lock()
+
+        # Stats
+        self.startup_time = 0
+        self.export_times = []  # (file name, seconds)
+
+    def acquire(self):
+        with self.lock:
+            if self.available.empty() and len(self.drivers) < self.size:
+                # Imported here, as it requires selenium (only needed for static exports)
+                from bokeh.io.webdriver import webdriver_control
+                start = time.perf_counter()
+                driver = webdriver_control.create()
+                self.startup_time += time.perf_counter() - start
+                self.drivers.append(driver)
+                return driver
+        return self.available.get()
+
+    def release(self, driver):
+        self.available.put(driver)
+
+    def export(self, export_function, plot, filename):
+        driver = self.acquire()
+        try:
+            start = time.perf_counter()
+            export_function(plot, filename=filename, webdriver=driver)
+            self.export_times.append((filename, time.perf_counter() - start))
+        finally:
+            self.release(driver)
+
+    def close(self):
+        with self.lock:
+            if len(self.drivers) == 0:
+                return
+            from bokeh.io.webdriver import webdriver_control
+            for driver in self.drivers:
+                webdriver_control.terminate(driver)
+            self.drivers = []
+            self.available = queue.Queue()
+
+    def print_stats(self):
+        if len(self.export_times) == 0:
+            return
+        total = sum(seconds for _, seconds in self.export_times)
+        print(f"Static exports: {len(self.export_times)} in {total:.2f}s "
+              f"(avg {total / len(self.export_times):.2f}s per export), browser startup {self.startup_time:.2f}s")
+        for filename, seconds in self.export_times:
+            print(f"  {seconds:.2f}s: {filename}")
+        self.export_times = []
+        self.startup_time = 0
+
+
 class Bokeh:
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, executor=None, webdrivers=1):
         # Hard-coded plot params
         self.title_font_size = 20
         self.label_font_size = 20
@@ -39,106 +178,192 @@ class Bokeh:
 
         # Variable plot params
         self.groups = {}
-
-    def write_to_file(self, plot, output_formats, config=None, group=None):
+        self.group_sources = {}  # Group -> SharedSources
+
+        # Thread pool to write the plots to file in the background (writes are done inline if None)
+        self.executor = executor
+        self.pending_writes = []
+
+        # Browsers for static exports
+        self.webdriver_pool = WebdriverPool(webdrivers)
+
+    def get_output_file_name(self, config=None, group=None):
+        return get_output_file_name(self.root_dir, config, group)
+
+    def get_output_files(self, output_formats, config=None, group=None):
+        return get_output_files(self.root_dir, output_formats, config, group)
+
+    # Write a dashboard: an index page with a placeholder per plot, and a script per plot with its document (in a
+    # directory next to the index page), which is only loaded when the plot is scrolled into view
+    def write_dashboard(self, plots, output_file_name, title):
+        plots_dir = f"{output_file_name}_dashboard"
+        os.makedirs(plots_dir, exist_ok=True)
+        placeholders = []
+        for i, plot in enumerate(plots):
+            plot_id = f"plot_{i}"
+            with open(os.path.join(plots_dir, f"{plot_id}.js"), "w") as f:
+                f.write(f"loadDashboardPlot({json.dumps(plot_id)}, {json.dumps(json_item(plot, plot_id))});\n")
+            # json_item() leaves the plot in a document of its own, which would keep it from being written again
+            if plot.document is not None:
+                plot.document.remove_root(plot)
+            # Sized as the plot (if known), so that only the plots in view are loaded
+            width = getattr(plot, "width", None) or self.plot_dimension[0]
+            height = getattr(plot, "height", None) or self.plot_dimension[1]
+            placeholders.append(f'<div id="{plot_id}" data-src="{os.path.basename(plots_dir)}/{plot_id}.js" '
+                                f'style="width: {width}px; min-height: {height}px;"></div>')
+        with open(get_output_file(output_file_name, "dashboard"), "w") as f:
+            f.write(DASHBOARD_TEMPLATE.substitute(title=title, resources=CDN.render_js(),
+                                                  columns=min(len(plots), self.grid_columns),
+                                                  plots="\n".join(placeholders)))
+
+    # plots are the plots of the group (if a group) for dashboards, as they are loaded one by one
+    def write_to_file(self, plot, output_formats, config=None, group=None, plots=None):
         # Write to file
         if config is None and group is None:
             warnings.warn("Either config or group should be present when writing to file!")
-        output_path = ""
-        # Discard output path from group
-        if group is not None:
-            output_path, group = str(group).split(":")
-
-        if config is None:
-            config = {
-                "results_file": "results.json",
-                "output_path": output_path,
-                "plot": {
-                    "title": str(group)
-                },
-                "output_file": "plot"
-            }
-        os.chdir(self.root_dir)
-        plot_dir = os.path.abspath(os.path.join(config["results_file"], os.pardir, "plots",
-                                                config["output_path"]))
-        if not os.path.exists(plot_dir):
-            os.makedirs(plot_dir)
-        os.chdir(plot_dir)
-        output_file_name = f'{config["output_file"]}' if group is None else f'{str(group)}'
+        output_file_name, _ = self.get_output_file_name(config, group)
+        os.makedirs(os.path.dirname(output_file_name), exist_ok=True)
+        title = config["plot"]["title"] if group is None else str(group).split(":")[-1]
 
         for output_format in output_formats:
-            if output_format not in ["html", "svg", "png"]:
+            if output_format not in BOKEH_FORMATS:
                 warnings.warn("Output format not supported. Defaulting to html")
                 output_format = "html"
-            if output_format == "html":
-                html = file_html(plot, CDN, config["plot"]["title"] if group is None else str(group))
+            record = profiler.start("write", plot=title, detail=get_output_file(output_file_name, output_format))
+            if output_format == "dashboard":
+                self.write_dashboard(plots if plots is not None else [plot], output_file_name, title)
+            elif output_format == "html":
+                html = file_html(plot, CDN, title)
                 with open(output_file_name + ".html", "w") as f:
                     f.write(html)
             elif output_format == "svg":
-                export_svg(plot, filename=output_file_name + ".svg")
+                self.webdriver_pool.export(export_svg, plot, output_file_name + ".svg")
             elif output_format == "png":
                 curr_toolbar_location = plot.toolbar_location
                 plot.toolbar_location = None
-                export_png(plot, filename=output_file_name + ".png")
+                self.webdriver_pool.export(export_png, plot, output_file_name + ".png")
                 plot.toolbar_location = curr_toolbar_location
+            if os.path.exists(record["detail"]):
+                record["bytes"] = os.path.getsize(record["detail"])
+            profiler.stop(record)
+
+    def submit_write(self, *args, **kwargs):
+        # Writing in the background lets the write overlap with rendering the next plot
+        if self.executor is None:
+            self.write_to_file(*args, **kwargs)
+        else:
+            self.pending_writes.append(self.executor.submit(self.write_to_file, *args, **kwargs))
+
+    def wait_for_writes(self):
+        pending_writes, self.pending_writes = self.pending_writes, []
+        for write in pending_writes:
+            # Raises the exception of the write, if any
+            write.result()
+
+    def close_webdrivers(self):
+        self.webdriver_pool.close()
+        self.webdriver_pool.print_stats()
+
+    # Write a group (e.g. once its last member is plotted), and release its plots
+    def write_group(self, group):
+        if group not in self.groups:
+            return
+        plots, output_format = self.groups.pop(group)
+        self.group_sources.pop(group, None)
+        grid = gridplot(plots, ncols=self.grid_columns)
+        self.submit_write(grid, output_formats=output_format, group=group, plots=plots)
 
+    # Write the groups which are left (all of them, unless written by write_group() already)
     def write_group_plots(self):
         if len(self.groups) == 0:
+            self.wait_for_writes()
+            self.close_webdrivers()
             return
         print("Writing group plots to file...")
         progress_bar = progressbar.ProgressBar(max_value=len(self.groups))
-        progress = 0
-        for group, (plots, output_format) in self.groups.items():
-            grid = gridplot(plots, ncols=self.grid_columns)
-            self.write_to_file(grid, output_formats=output_format, group=group)
-            progress += 1
-            progress_bar.update(progress)
+        for progress, group in enumerate(list(self.groups)):
+            self.write_group(group)
+            progress_bar.update(progress + 1)
         progress_bar.finish()
+        self.wait_for_writes()
+        self.close_webdrivers()
 
     @staticmethod
-    def get_heatmap_color(min_val: float, max_val: float, value: float):
-        if value < min_val or value > max_val:
-            print("Value is out of range for heatmap. This should never happen! Report this bug")
+    def get_rgb(color):
+        if color.startswith("#") and len(color) == 7:
+            return tuple(int(color[idx:idx + 2], 16) for idx in (1, 3, 5))
+        named_color = getattr(named, color.lower(), None)
+        if named_color is None:
+            warnings.warn(f"Unknown color {color}. Using black")
+            return 0, 0, 0
+        return named_color.r, named_color.g, named_color.b
 
-        ratio = (value - min_val) / (max_val - min_val)
-        r = int(255 * ratio)
-        g = int(255 * (1 - ratio))
-        b = 0
-
-        return r, g, b
+    @staticmethod
+    def plot_density(plot, series, density_params, color):
+        density = get_density(series.x, series.y, **density_params)
+        if density is None:
+            return
+        density, x_edges, y_edges, outliers = density
+        # A single image (packed RGBA) for the whole series
+        image = get_density_rgba(density, Bokeh.get_rgb(color)).view(np.uint32).reshape(density.shape)
+        kwargs = {
+            "y_range_name": series.position,
+            "visible": series.visible
+        }
+        if series.legend is not None:
+            kwargs["legend_label"] = series.legend
+        plot.image_rgba(image=[image], x=x_edges[0], y=y_edges[0], dw=x_edges[-1] - x_edges[0],
+                        dh=y_edges[-1] - y_edges[0], **kwargs)
+        if outliers is not None and len(outliers) > 0:
+            plot.scatter(series.x[outliers], series.y[outliers], color=color, size=4, alpha=0.8, **kwargs)
 
     @staticmethod
-    def plot_scatter(plot, values, i):
-        x_axis_values, x_axis_err, y_axis_values, y_axis_err, legend, position, visible, labels, color, marker = values
-        color = color if color is not None else colors[color_list[i % len(color_list)]]
+    def plot_scatter(plot, series, config, i, sources):
+        color = series.color if series.color is not None else colors[color_list[i % len(color_list)]]
+        if config["plot"]["scatter"]["density"] is not None:
+            if series.x.dtype.kind in "biuf":
+                Bokeh.plot_density(plot, series, config["plot"]["scatter"]["density"], color)
+                return
+            warnings.warn("Density scatter plots need numeric X-axis values. Plotting the points instead")
         dot_size = 10
-        args = []
-        if x_axis_values is not None:
-            args.append(x_axis_values)
-        args.append(y_axis_values)
+        x_axis_values = series.x if series.x is not None else np.arange(len(series.y))
+        source = sources.get({"x": x_axis_values, "y": series.y})
 
         kwargs = {
             "color": color,
             "line_color": color,
             "size": dot_size,
-            "marker": marker,
+            "marker": series.marker,
             "alpha": 0.8,
             "muted_color": color,
             "muted_alpha": 0.2,
-            "y_range_name": position,
-            "visible": visible
+            "y_range_name": series.position,
+            "visible": series.visible
         }
-        if legend is not None:
-            kwargs["legend_label"] = legend
+        if series.legend is not None:
+            kwargs["legend_label"] = series.legend
 
-        plot.scatter(*args, **kwargs)
+        plot.scatter("x", "y", source=source, **kwargs)
 
     @staticmethod
-    def plot_line(plot, values, i):
-        x_axis_values, x_axis_err, y_axis_values, y_axis_err, legend, position, visible, labels, color, marker = values
-        color = color if color is not None else colors[color_list[i % len(color_list)]]
+    def plot_line(plot, series, i, sources):
+        x_axis_values, y_axis_values = series.x, series.y
+        legend, position, visible, marker = series.legend, series.position, series.visible, series.marker
+        color = series.color if series.color is not None else colors[color_list[i % len(color_list)]]
         if x_axis_values is None:
-            x_axis_values = range(len(y_axis_values))
+            x_axis_values = np.arange(len(y_axis_values))
+
+        # One source for all the glyphs of the series, so that every column is written to the output only once
+        data = {"x": x_axis_values, "y": y_axis_values}
+        has_x_err = series.has_x_err and np.any(series.x_err != 0)
+        has_y_err = series.has_y_err and np.any(series.y_err != 0)
+        if has_x_err:
+            data["upper_x"] = x_axis_values + series.x_err
+            data["lower_x"] = x_axis_values - series.x_err
+        if has_y_err:
+            data["upper_y"] = y_axis_values + series.y_err
+            data["lower_y"] = y_axis_values - series.y_err
+        source = sources.get(data)
 
         # Draw line and points
         line_kwargs = {
@@ -164,27 +389,20 @@ class Bokeh:
         if legend is not None:
             line_kwargs["legend_label"] = scatter_kwargs["legend_label"] = legend
 
-        plot.line(x_axis_values, y_axis_values, **line_kwargs)
-        plot.scatter(x_axis_values, y_axis_values, **scatter_kwargs)
+        plot.line("x", "y", source=source, **line_kwargs)
+        plot.scatter("x", "y", source=source, **scatter_kwargs)
 
         # Draw error bars
-        upper_x = pd.Series([x + err for x, err in zip(x_axis_values, x_axis_err)], index=x_axis_values)
-        lower_x = pd.Series([x - err for x, err in zip(x_axis_values, x_axis_err)], index=x_axis_values)
-        upper_y = pd.Series([y + err for y, err in zip(y_axis_values, y_axis_err)], index=x_axis_values)
-        lower_y = pd.Series([y - err for y, err in zip(y_axis_values, y_axis_err)], index=x_axis_values)
-
-        source_x = ColumnDataSource(data=dict(base=y_axis_values, upper=upper_x, lower=lower_x))
-        source_y = ColumnDataSource(data=dict(base=x_axis_values, upper=upper_y, lower=lower_y))
-        if x_axis_err != [0] * len(x_axis_err):
-            plot.add_layout(Whisker(base="base", upper="upper", lower="lower", level='glyph', dimension='width',
-                                    source=source_x, line_color='black', y_range_name=position,
+        if has_x_err:
+            plot.add_layout(Whisker(base="y", upper="upper_x", lower="lower_x", level='glyph', dimension='width',
+                                    source=source, line_color='black', y_range_name=position,
                                     visible=visible))
-        if y_axis_err != [0] * len(y_axis_err):
+        if has_y_err:
             varea_kwargs = {
-                "x": "base",
-                "y1": "lower",
-                "y2": "upper",
-                "source": source_y,
+                "x": "x",
+                "y1": "lower_y",
+                "y2": "upper_y",
+                "source": source,
                 "fill_color": color,
                 "fill_alpha": 0.15,
                 "y_range_name": position,
@@ -195,29 +413,30 @@ class Bokeh:
             plot.varea(**varea_kwargs)
 
     @staticmethod
-    def plot_histogram(plot, values, config, i):
-        x_axis_values, x_axis_err, y_axis_values, y_axis_err, legend, position, visible, labels, color, marker = values
-        color = color if color is not None else colors[color_list[i % len(color_list)]]
+    def plot_histogram(plot, series, config, i, sources):
+        legend, position, visible = series.legend, series.position, series.visible
+        color = series.color if series.color is not None else colors[color_list[i % len(color_list)]]
         bin_width = config["plot"]["histogram"]["bin_width"]
-        if x_axis_values is not None:
-            data = x_axis_values
+        if series.x is not None:
+            data = series.x
         else:
-            data = y_axis_values
+            data = series.y
 
-        data = [elem for elem in data if not np.isnan(elem)]
+        data = data[~np.isnan(data)]
         if bin_width != 0:
-            bins = np.arange(min(data), max(data), bin_width)
+            bins = np.arange(np.min(data), np.max(data), bin_width)
         else:
             bins = "auto"
 
         hist, edges = np.histogram(data, bins=bins)
-        hist = hist / sum(hist)
+        hist = hist / np.sum(hist)
 
         kwargs = {
-            "top": hist,
+            "top": "top",
             "bottom": 0,
-            "left": edges[:-1],
-            "right": edges[1:],
+            "left": "left",
+            "right": "right",
+            "source": sources.get({"top": hist, "left": edges[:-1], "right": edges[1:]}),
             "fill_color": color,
             "line_color": "white",
             "alpha": 0.8,
@@ -238,50 +457,48 @@ class Bokeh:
         plot.yaxis.formatter = NumeralTickFormatter(format="0%")
 
     @staticmethod
-    def plot_heatmap(plot, values, i):
-        x_axis_values, x_axis_err, y_axis_values, y_axis_err, legend, position, visible, labels, color, marker = values
-        color = color if color is not None else colors[color_list[i % len(color_list)]]
-        if labels is None:
+    def plot_heatmap(plot, series, i, sources):
+        if series.labels is None:
             print("Heatmap requires labels for y axes")
             return -1
-        min_val = np.nanmin(
-            [float(label) if isinstance(label, (numbers.Number, str)) else float('nan') for label in labels])
-        max_val = np.nanmax(
-            [float(label) if isinstance(label, (numbers.Number, str)) else float('nan') for label in labels])
-        for j in range(0, len(x_axis_values)):
-            if labels[j] is None:
-                continue
-            plot.rect(x=x_axis_values[j], y=y_axis_values[j], width=1, height=1,
-                      fill_color=Bokeh.get_heatmap_color(min_val, max_val, float(labels[j])),
-                      line_color=None)
-
-    def plot_by_type(self, plot, config, values):
+        values = get_heatmap_values(series.labels)
+        valid = ~np.isnan(values)
+        if not np.any(valid):
+            return -1
+        # A single glyph for all the cells (the same cells as the matplotlib heatmaps), colored by the color mapper
+        x_indices, x_edges = get_heatmap_cells(series.x[valid])
+        y_indices, y_edges = get_heatmap_cells(series.y[valid])
+        source = sources.get({"left": x_edges[x_indices], "right": x_edges[x_indices + 1],
+                              "bottom": y_edges[y_indices], "top": y_edges[y_indices + 1], "value": values[valid]})
+        mapper = LinearColorMapper(palette=HEATMAP_PALETTE, low=np.min(values[valid]), high=np.max(values[valid]))
+        plot.quad(left="left", right="right", bottom="bottom", top="top", source=source,
+                  fill_color={"field": "value", "transform": mapper}, line_color=None)
+
+    def plot_by_type(self, plot, config, values, sources):
         plot_type = config["plot"]["type"]
         label_offset_x = 5
         label_offset_y = 5
-        for i in range(0, len(values)):
-            x_axis_values, x_axis_err, y_axis_values, y_axis_err, legend, position, visible, labels, color, marker \
-                = values[i]
+        for i, series in enumerate(values):
             # Skip the plot if no parameters were found
-            if y_axis_values is None or len(y_axis_values) == 0:
+            if series.y is None or len(series.y) == 0:
                 return -1
 
             if plot_type == "line":
-                self.plot_line(plot, values[i], i)
+                self.plot_line(plot, series, i, sources)
             elif plot_type == "scatter":
-                self.plot_scatter(plot, values[i], i)
+                self.plot_scatter(plot, series, config, i, sources)
             elif plot_type == "histogram":
-                self.plot_histogram(plot, values[i], config, i)
+                self.plot_histogram(plot, series, config, i, sources)
             elif plot_type == "heatmap":
-                self.plot_heatmap(plot, values[i], i)
+                self.plot_heatmap(plot, series, i, sources)
                 label_offset_x = label_offset_y = 0
             else:
                 warnings.warn(f"Invalid plot type, skipping plot with title {config['plot']['title']}")
                 return -1
 
             # Add Labels
-            if labels is not None:
-                source = ColumnDataSource(data=dict(x=x_axis_values, y=y_axis_values, labels=labels))
+            if series.labels is not None:
+                source = sources.get({"x": series.x, "y": series.y, "labels": series.labels})
                 label_set = LabelSet(x='x', y='y', text='labels', source=source,
                                      x_offset=label_offset_x, y_offset=label_offset_y,
                                      text_font_size=f"{self.label_font_size / 2}pt",
@@ -291,6 +508,9 @@ class Bokeh:
 
     # Plot the values based on the x_axis_values and y_axis_values
     def plot(self, config, values):
+        record = profiler.start("render", plot=config["plot"]["title"])
+        record["points"] = sum(len(series.y) for series in values)
+
         # Plot hover
         tooltips = [("(x, y)", "($x, $y)"), ("mode", "vline")]
 
@@ -349,45 +569,24 @@ class Bokeh:
             plot.yaxis.major_label_overrides = y_params["tick_labels"]
         plot.axis.major_label_text_font_size = f"{self.tick_font_size}pt"
 
-        # Axis limits (min, max with 10% padding)
+        # Axis limits (min, max with 10% padding, or the edges of the cells for heatmaps)
         if config["plot"]["type"] != "histogram":
+            get_limits = get_heatmap_limits if config["plot"]["type"] == "heatmap" else get_axis_limits
             # X-axis
-            x_max = max([x + err for value in values for x, err, y in
-                         zip(value[0], value[1], value[2]) if not np.isnan(x) and not np.isnan(y)], default=10)
-            x_min = min([x - err for value in values for x, err, y in
-                         zip(value[0], value[1], value[2]) if not np.isnan(x) and not np.isnan(y)], default=0)
-            diff = x_max - x_min
-            diff = diff if diff > 0 else x_max * 0.1
-            x_max = x_max + 0.1 * diff
-            x_min = x_min - 0.1 * diff
-            plot.x_range = Range1d(x_min, x_max)
+            x_limits = get_limits(values, "x")
+            if x_limits is not None:
+                plot.x_range = Range1d(*x_limits)
 
             # Left Y-axis
-            y_max = max(
-                [y + err for value in values if value[5] == "default"
-                 for y, err, x in zip(value[2], value[3], value[0]) if not np.isnan(y) and not np.isnan(x)], default=10)
-            y_min = min(
-                [y - err for value in values if value[5] == "default"
-                 for y, err, x in zip(value[2], value[3], value[0]) if not np.isnan(y) and not np.isnan(x)], default=0)
-            diff = y_max - y_min
-            diff = diff if diff > 0 else y_max * 0.1
-            y_max = y_max + 0.1 * diff
-            y_min = y_min - 0.1 * diff
-            plot.y_range = Range1d(y_min, y_max)
+            y_limits = get_limits([value for value in values if value.position == "default"], "y")
+            if y_limits is not None:
+                plot.y_range = Range1d(*y_limits)
 
             # Right Y-axis
-            if any(value[5] == "right" for value in values):
-                y_max = max(
-                    [y + err for value in values if value[5] == "right" for y, err, x in
-                     zip(value[2], value[3], value[0]) if not np.isnan(y) and not np.isnan(x)], default=10)
-                y_min = min(
-                    [y - err for value in values if value[5] == "right" for y, err, x in
-                     zip(value[2], value[3], value[0]) if not np.isnan(y) and not np.isnan(x)], default=0)
-                diff = y_max - y_min
-                diff = diff if diff > 0 else y_max * 0.1
-                y_max = y_max + 0.1 * diff
-                y_min = y_min - 0.1 * diff
-                plot.extra_y_ranges["right"] = Range1d(y_min, y_max)
+            if any(value.position == "right" for value in values):
+                y_limits = get_limits([value for value in values if value.position == "right"], "y")
+                if y_limits is not None:
+                    plot.extra_y_ranges["right"] = Range1d(*y_limits)
                 # Add the right axis
                 right_y_axis = LinearAxis(
                     axis_label=y_params["label_right"],
@@ -400,7 +599,15 @@ class Bokeh:
                 plot.add_layout(right_y_axis, "right")
 
         # Plot the values
-        retval = self.plot_by_type(plot, config, values)
+        # The plots of a group are written as one document, so they can share their sources (except in a dashboard, as
+        # each plot is a document of its own there). The first output format of the group is used
+        group = config["plot"]["group"]
+        output_format = self.groups[group][1] if group in self.groups else config["plot"]["output_format"]
+        if group is not None and "dashboard" not in output_format:
+            sources = self.group_sources.setdefault(group, SharedSources())
+        else:
+            sources = SharedSources()
+        retval = self.plot_by_type(plot, config, values, sources)
         if retval == -1:
             return -1
 
@@ -419,10 +626,11 @@ class Bokeh:
         if config["plot"]["notes"] is not None:
             notes = Div(text=config["plot"]["notes"])
             plot = column(plot, notes)
+        profiler.stop(record)
 
         if config["plot"]["group"] is not None:
             if config["plot"]["group"] not in self.groups:
                 self.groups[config["plot"]["group"]] = ([], config["plot"]["output_format"])
             self.groups[config["plot"]["group"]][0].append(plot)
         else:
-            self.write_to_file(plot, config["plot"]["output_format"], config=config)
+            self.submit_write(plot, config["plot"]["output_format"], config=config)
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "plots_manifest.json"
+
+
+# Records what every output file was built from, so that outputs whose config and results files have not changed can
+# be skipped. A manifest is kept next to each plots directory, and maps each output file to:
+# {"config": hash of the checked config(s), "inputs": {results_file: [size, mtime, content hash]}}
+class BuildManifest:
+    def __init__(self):
+        self.manifests = {}  # manifest path -> {output file -> entry}
+        self.fingerprints = {}  # results file -> [size, mtime, content hash] (computed once per run)
+
+    def get_manifest(self, plots_parent_dir):
+        manifest_path = os.path.join(plots_parent_dir, MANIFEST_FILE)
+        if manifest_path not in self.manifests:
+            try:
+                with open(manifest_path, "r") as f:
+                    self.manifests[manifest_path] = json.load(f)
+            except (OSError, ValueError):
+                self.manifests[manifest_path] = {}
+        return self.manifests[manifest_path]
+
+    @staticmethod
+    def hash_config(config):
+        # Non-JSON objects (if any) are hashed by their type only
+        normalized = json.dumps(config, sort_keys=True, default=lambda obj: type(obj).__name__)
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def get_fingerprint(self, results_file):
+        if results_file in self.fingerprints:
+            return self.fingerprints[results_file]
+        stat = os.stat(results_file)
+        fingerprint = None
+        # Reuse the content hash of any manifest with the same size and mtime, to avoid hashing large files again
+        for manifest in self.manifests.values():
+            for entry in manifest.values():
+                recorded = entry["inputs"].get(results_file)
+                if recorded is not None and recorded[0] == stat.st_size and recorded[1] == stat.st_mtime_ns:
+                    fingerprint = recorded
+                    break
+            if fingerprint is not None:
+                break
+        if fingerprint is None:
+            content_hash = hashlib.sha256()
+            with open(results_file, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    content_hash.update(chunk)
+            fingerprint = [stat.st_size, stat.st_mtime_ns, content_hash.hexdigest()]
+        self.fingerprints[results_file] = fingerprint
+        return fingerprint
+
+    # Get the entry for an output file built from the given (checked) configs (more than one for groups)
+    def get_entry(self, plots_parent_dir, configs):
+        # Load the manifest first, so that its content hashes can be reused
+        self.get_manifest(plots_parent_dir)
+        config_hash = hashlib.sha256()
+        for config in configs:
+            config_hash.update(self.hash_config(config).encode())
+        results_files = sorted({config["results_file"] for config in configs})
+        return {
+            "config": config_hash.hexdigest(),
+            "inputs": {results_file: self.get_fingerprint(results_file) for results_file in results_files}
+        }
+
+    def is_up_to_date(self, plots_parent_dir, output_files, entry):
+        manifest = self.get_manifest(plots_parent_dir)
+        for output_file in output_files:
+            if not os.path.exists(output_file) or output_file not in manifest:
+                return False
+            recorded = manifest[output_file]
+            if recorded["config"] != entry["config"] or recorded["inputs"].keys() != entry["inputs"].keys():
+                return False
+            # Only the content matters (a results file which was touched, but not changed, is still up-to-date)
+            for results_file, fingerprint in entry["inputs"].items():
+                if recorded["inputs"][results_file][0] != fingerprint[0] \
+                        or recorded["inputs"][results_file][2] != fingerprint[2]:
+                    return False
+        return True
+
+    def record(self, plots_parent_dir, output_files, entry):
+        manifest = self.get_manifest(plots_parent_dir)
+        for output_file in output_files:
+            manifest[output_file] = entry
+
+    def save(self):
+        for manifest_path, manifest in self.manifests.items():
+            if len(manifest) == 0:
+                continue
+            with open(manifest_path, "w") as f:
+                json.dump(manifest, f, indent=2)
@@ -1,4 +1,5 @@
-import json
+import array
+import functools
 import numbers
 import os
 import re
@@ -6,6 +7,13 @@ import warnings
 
 import numpy as np
 
+from profiler import profiler
+from results_cache import results_cache
+
+PATH_SEGMENT_REGEX = re.compile(r"([^\[\].]*)((\[\d+])*)")
+PATH_INDEX_REGEX = re.compile(r"\[(\d+)]")
+DOWNSAMPLE_METHODS = ["lttb", "minmax", "stride"]
+
 
 def get_scale_by_value(value, scale_by):
     if scale_by == "min":
@@ -20,73 +28,477 @@ def get_scale_by_value(value, scale_by):
         return scale_by
 
 
-# Get the value of a parameter from the results JSON object
-def get_param_value(param_path, json_object, min_cutoff, max_cutoff):
-    split_path = param_path.split(".")
-    value = json_object
+# Compile a param path (e.g. [0].x[0][1].w) into its keys and indices (e.g. (0, "x", 0, 1, "w"))
+# Compiled paths are memoized, as configs usually reuse a few path shapes many times
+@functools.lru_cache(maxsize=None)
+def compile_param_path(param_path):
+    steps = []
+    for key in param_path.split("."):
+        match = PATH_SEGMENT_REGEX.fullmatch(key)
+        if not match or key == "":
+            raise ValueError(f"Invalid param path: {param_path}. Segment '{key}' must be a key optionally followed "
+                             f"by indices (e.g. x[0][1]), or only indices (e.g. [0])")
+        if match.group(1) != "":
+            steps.append(match.group(1))
+        steps += [int(index) for index in PATH_INDEX_REGEX.findall(match.group(2))]
+    return tuple(steps)
+
+
+# Get all the param paths (values, errors and labels) that a config reads from its results file
+def get_param_paths(config):
+    param_paths = set()
+    for axis in [config["x_axis"], config["y_axis"]]:
+        for value in axis["values"]:
+            param_paths.add(value["param"])
+            if value["error"] is not None:
+                param_paths.add(value["error"])
+            if isinstance(value.get("labels"), str):
+                param_paths.add(value["labels"])
+    return param_paths
+
+
+# Merge the given param paths into a prefix trie, so that shared prefixes are only traversed once
+def build_param_trie(param_paths):
+    trie = {"paths": [], "children": {}}
+    for param_path in param_paths:
+        node = trie
+        for step in compile_param_path(param_path):
+            node = node["children"].setdefault(step, {"paths": [], "children": {}})
+        node["paths"].append(param_path)
+    return trie
+
+
+# Walk the (sub-)trie over the (sub-)tree of the results JSON object, and store the values of all its params
+def walk_param_trie(trie, json_object, extracted):
+    stack = [(trie, json_object)]
+    while len(stack) > 0:
+        node, value = stack.pop()
+        for param_path in node["paths"]:
+            extracted[param_path] = value
+        for step, child in node["children"].items():
+            try:
+                stack.append((child, value[step]))
+            except (KeyError, IndexError, TypeError):
+                # Missing params are reported when they are looked up
+                continue
+    return extracted
+
+
+# Extract all the given param paths from the results JSON object in a single walk
+# Profiled as a stage of the results file (not of a plot), as it is shared by all the plots of the results file
+def extract_param_paths(param_paths, json_object, results_file=""):
+    with profiler.stage("extract", plot="", detail=results_file):
+        return walk_param_trie(build_param_trie(param_paths), json_object, {})
+
+
+# Accumulates a JSON array of numbers directly into a compact buffer (instead of a list of boxed Python numbers)
+# Falls back to a list as soon as a non-numeric element shows up, so the result matches what json.load() would give
+class NumericArrayBuilder:
+    def __init__(self):
+        self.buffer = array.array("q")
+        self.fallback = None
+
+    def append(self, elem):
+        if self.fallback is not None:
+            self.fallback.append(elem)
+        elif isinstance(elem, int) and not isinstance(elem, bool) and -2 ** 63 <= elem < 2 ** 63:
+            self.buffer.append(elem)
+        elif isinstance(elem, float):
+            if self.buffer.typecode == "q":
+                self.buffer = array.array("d", self.buffer)
+            self.buffer.append(elem)
+        else:
+            self.fallback = self.buffer.tolist()
+            self.fallback.append(elem)
+            self.buffer = None
+
+    def build(self):
+        if self.fallback is not None:
+            return self.fallback
+        return np.frombuffer(self.buffer, dtype=np.int64 if self.buffer.typecode == "q" else np.float64)
+
+
+# Extract all the given param paths from the results file without loading all of it in memory
+# The file is parsed as a stream of events, and only the subtrees matched by the param paths are built
+def stream_param_paths(param_paths, results_file):
     try:
-        for key in split_path:
-            match = re.match(r"([^\[\]]*)((\[\d+])*)", key)
-            if match:
-                key = match.group(1)
-                indices = re.findall(r"\[(\d+)]", match.group(2))
-                if key is not None and key != "":
-                    value = value[key]
-                for index in indices:
-                    value = value[int(index)]
-    except (KeyError, IndexError, TypeError):
+        import ijson
+    except ImportError:
+        raise ImportError("Streaming results files requires ijson. Install it with: pip3 install ijson")
+
+    record = profiler.start("load", plot="", detail=results_file)
+    trie = build_param_trie(param_paths)
+    extracted = {}
+    # Each frame is an open container: [is_map, trie node, current key or index, builder, is_param_root]
+    # The trie node is None for skipped subtrees, and builder is None for containers that are not being built
+    stack = []
+    with open(results_file, "rb") as f:
+        for _, event, value in ijson.parse(f, use_float=True):
+            if event == "map_key":
+                stack[-1][2] = value
+                continue
+            if event in ("end_map", "end_array"):
+                is_map, node, _, builder, is_param_root = stack.pop()
+                if builder is None:
+                    continue
+                value = builder.build() if isinstance(builder, NumericArrayBuilder) else builder
+                if is_param_root:
+                    walk_param_trie(node, value, extracted)
+                elif stack[-1][0]:
+                    stack[-1][3][stack[-1][2]] = value
+                else:
+                    stack[-1][3].append(value)
+                continue
+
+            # A new value starts. Find where it is in the trie
+            if len(stack) == 0:
+                parent_node, parent_builder, node = None, None, trie
+            else:
+                parent = stack[-1]
+                parent_node, parent_builder = parent[1], parent[3]
+                step = parent[2]
+                if not parent[0]:
+                    parent[2] += 1
+                node = parent_node["children"].get(step) if parent_node is not None and parent_builder is None \
+                    else None
+
+            if event in ("start_map", "start_array"):
+                is_map = event == "start_map"
+                if parent_builder is not None:
+                    # Part of a param's subtree
+                    stack.append([is_map, None, None if is_map else 0, {} if is_map else [], False])
+                elif node is not None and len(node["paths"]) > 0:
+                    # Root of a param's subtree
+                    builder = {} if is_map else NumericArrayBuilder()
+                    stack.append([is_map, node, None if is_map else 0, builder, True])
+                else:
+                    # Either on the way to a param (node is not None), or skipped
+                    stack.append([is_map, node, None if is_map else 0, None, False])
+            elif parent_builder is not None:
+                if parent[0]:
+                    parent_builder[step] = value
+                else:
+                    parent_builder.append(value)
+            elif node is not None and len(node["paths"]) > 0:
+                walk_param_trie(node, value, extracted)
+    record["bytes"] = os.path.getsize(results_file)
+    profiler.stop(record)
+    return extracted
+
+
+# Get the value of a parameter from the params extracted from the results JSON object
+def get_param_value(param_path, extracted, min_cutoff, max_cutoff):
+    if param_path not in extracted:
         warning = "Could not find the parameter at path: " + param_path + ". Skipping specified param..."
         warnings.warn(warning)
         return []
-    if isinstance(min_cutoff, str):
-        min_cutoff = np.percentile(value, float(min_cutoff[1:]))
-    if isinstance(max_cutoff, str):
-        max_cutoff = np.percentile(value, float(max_cutoff[1:]))
+    value = extracted[param_path]
+    if min_cutoff is None and max_cutoff is None:
+        return value
+
+    # Convert to a float array once, dropping the non-numeric elements
+    numeric = np.asarray(value)
+    if numeric.dtype.kind not in "biuf":
+        numeric = np.array([elem for elem in value if isinstance(elem, numbers.Number)], dtype=np.float64)
+    value = numeric.astype(np.float64)
+
+    # Both percentiles in a single pass
+    percentiles = [float(cutoff[1:]) for cutoff in [min_cutoff, max_cutoff] if isinstance(cutoff, str)]
+    if len(percentiles) > 0:
+        percentiles = list(np.percentile(value, percentiles))
+        if isinstance(min_cutoff, str):
+            min_cutoff = percentiles.pop(0)
+        if isinstance(max_cutoff, str):
+            max_cutoff = percentiles.pop(0)
+
     if min_cutoff is not None:
-        value = [np.nan if elem < min_cutoff else elem for elem in value if isinstance(elem, numbers.Number)]
+        value[value < min_cutoff] = np.nan
     if max_cutoff is not None:
-        value = [np.nan if elem > max_cutoff else elem for elem in value if isinstance(elem, numbers.Number)]
-    if min_cutoff is not None or max_cutoff is not None:
-        nan_count = np.sum(np.isnan(value))
-        if min_cutoff is not None or max_cutoff is not None:
-            print("% of values removed due to cutoffs from path", param_path, "is",
-                  nan_count / len(value) * 100, "%")
+        value[value > max_cutoff] = np.nan
+    nan_count = np.isnan(value).sum()
+    print("% of values removed due to cutoffs from path", param_path, "is",
+          nan_count / len(value) * 100, "%")
+    # Keep integers as integers if nothing was removed
+    if nan_count == 0 and numeric.dtype.kind in "biu":
+        return numeric
     return value
 
 
+# Get the indices of the min and the max of each of the buckets (of consecutive points) of y
+def get_minmax_indices(y, buckets):
+    bucket_size = -(-len(y) // buckets)
+    buckets = -(-len(y) // bucket_size)
+    # Pad the last bucket, and ignore NaNs (and the padding)
+    padded = np.full(buckets * bucket_size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(buckets, bucket_size)
+    nan = np.isnan(padded)
+    offsets = np.arange(buckets) * bucket_size
+    min_indices = np.argmin(np.where(nan, np.inf, padded), axis=1) + offsets
+    max_indices = np.argmax(np.where(nan, -np.inf, padded), axis=1) + offsets
+    return np.minimum(np.concatenate([min_indices, max_indices]), len(y) - 1)
+
+
+# Largest-Triangle-Three-Buckets: keep the point of each bucket which forms the largest triangle with the point kept
+# from the previous bucket and the average of the next bucket
+# The buckets are walked in order (as each depends on the previous one), but each bucket is handled vectorized
+def get_lttb_indices(x, y, target_points):
+    n = len(y)
+    # The first and last points are kept as they are, and the rest are split into target_points - 2 buckets
+    edges = np.linspace(1, n - 1, target_points - 1).astype(np.int64)
+    valid = ~np.isnan(y)
+    counts = np.add.reduceat(valid[:n - 1].astype(np.int64), edges[:-1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_avg = np.add.reduceat(np.where(valid, x, 0)[:n - 1], edges[:-1]) / counts
+        y_avg = np.add.reduceat(np.where(valid, y, 0)[:n - 1], edges[:-1]) / counts
+    # The third point of the triangles of each bucket (the last point for the last bucket)
+    next_x = np.append(x_avg[1:], x[n - 1])
+    next_y = np.append(y_avg[1:], y[n - 1])
+
+    indices = np.empty(target_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for bucket in range(len(edges) - 1):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs((x[previous] - next_x[bucket]) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y[bucket] - y[previous]))
+        previous = start + np.argmax(np.where(np.isnan(areas), -1, areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+# Get the (sorted) indices of the points to keep to downsample a series (sorted by x) to about target_points points
+# Besides the points picked by the method, the first, last, min and max points are always kept
+# Returns None if the series doesn't need to be downsampled
+def get_downsample_indices(x, y, target_points, method):
+    n = len(y)
+    if n <= target_points:
+        return None
+    y = y.astype(np.float64)
+    # Non-numeric X-axis values (e.g. categories) are spaced evenly
+    x = x.astype(np.float64) if x.dtype.kind in "biuf" else np.arange(n, dtype=np.float64)
+    if method == "stride":
+        indices = np.linspace(0, n - 1, target_points).astype(np.int64)
+    elif method == "minmax":
+        indices = get_minmax_indices(y, max(target_points // 2, 1))
+    else:
+        indices = get_lttb_indices(x, y, target_points)
+    extremes = [np.nanargmin(y), np.nanargmax(y)] if not np.all(np.isnan(y)) else []
+    return np.unique(np.concatenate([indices, [0, n - 1], extremes]).astype(np.int64))
+
+
+# Get the limits (min, max) of an axis ("x" or "y") over the given series, with 10% padding on both sides
+# Only the points where both X and Y are numbers (not NaN) count, and their errors (if any) widen the limits
+# Defaults to (0, 10) (before padding) without any such points. Returns None for non-numeric values (e.g. categories)
+def get_axis_limits(values, axis):
+    mins, maxs = [], []
+    for series in values:
+        if series.x.dtype.kind not in "biuf" or series.y.dtype.kind not in "biuf":
+            return None
+        length = min(len(series.x), len(series.y))
+        x, y = series.x[:length], series.y[:length]
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if not np.any(valid):
+            continue
+        axis_values = x if axis == "x" else y
+        has_err = series.has_x_err if axis == "x" else series.has_y_err
+        err = (series.x_err if axis == "x" else series.y_err)[:length] if has_err else 0
+        with np.errstate(all="ignore"):
+            mins.append(np.nanmin(np.where(valid, axis_values - err, np.nan)))
+            maxs.append(np.nanmax(np.where(valid, axis_values + err, np.nan)))
+    axis_min = float(min(mins, default=0))
+    axis_max = float(max(maxs, default=10))
+    diff = axis_max - axis_min
+    diff = diff if diff > 0 else axis_max * 0.1
+    return axis_min - 0.1 * diff, axis_max + 0.1 * diff
+
+
+# Bin a series into a grid of bins ([X, Y]) cells, for density plots
+# Returns the density of each cell (from 0 to 1, scaled "log" or "linear"), with rows from the lowest to the highest Y,
+# the edges of the cells on the X and Y-axes, and the indices of the outliers (the points with Y-axis values beyond
+# the given percentile, on either side), or None if there are no finite points
+def get_density(x, y, bins, scale, outliers=None):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not np.any(finite):
+        return None
+    counts, x_edges, y_edges = np.histogram2d(x[finite], y[finite], bins=bins)
+    counts = counts.T
+    if scale == "log":
+        density = np.log1p(counts) / np.log1p(counts.max())
+    else:
+        density = counts / counts.max()
+
+    outlier_indices = None
+    if outliers is not None:
+        low, high = np.percentile(y[finite], [100 - outliers, outliers])
+        outlier_indices = np.flatnonzero(finite & ((y < low) | (y > high)))
+    return density, x_edges, y_edges, outlier_indices
+
+
+# The colors of the heatmaps: from green (lowest value) to red (highest value)
+HEATMAP_PALETTE = [f"#{red:02x}{255 - red:02x}00" for red in range(256)]
+
+
+# Get the values of the cells of a heatmap (its labels) as floats. Missing (None) or non-numeric labels are NaN
+def get_heatmap_values(labels):
+    try:
+        # None is converted to NaN
+        return np.asarray(labels, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    values = np.full(len(labels), np.nan)
+    for idx, label in enumerate(labels):
+        try:
+            values[idx] = float(label)
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+# Get the cells of a heatmap on an axis. The cells are centered on the unique values of the axis, with their edges
+# halfway between them (so a unit-spaced heatmap has cells of size 1). Returns the index of the cell of each value, and
+# the edges of the cells
+def get_heatmap_cells(axis_values):
+    centers, indices = np.unique(np.asarray(axis_values, dtype=np.float64), return_inverse=True)
+    if len(centers) == 1:
+        return indices, np.array([centers[0] - 0.5, centers[0] + 0.5])
+    middles = (centers[1:] + centers[:-1]) / 2
+    return indices, np.concatenate([[centers[0] - (middles[0] - centers[0])], middles,
+                                    [centers[-1] + (centers[-1] - middles[-1])]])
+
+
+# Get a grid of the cells of a heatmap, for renderers which draw a mesh (instead of a glyph per cell)
+# Returns the X-axis edges, the Y-axis edges, and the grid of values (rows by Y-axis, NaN where there is no cell)
+def get_heatmap_grid(x, y, values):
+    valid = ~np.isnan(values)
+    x_indices, x_edges = get_heatmap_cells(np.asarray(x)[valid])
+    y_indices, y_edges = get_heatmap_cells(np.asarray(y)[valid])
+    grid = np.full((len(y_edges) - 1, len(x_edges) - 1), np.nan)
+    grid[y_indices, x_indices] = values[valid]
+    return x_edges, y_edges, grid
+
+
+# Get the limits of an axis ("x" or "y") of a heatmap: the outer edges of its cells, so that the cells on the edges are
+# shown whole. Returns None if there are no cells
+def get_heatmap_limits(values, axis):
+    mins, maxs = [], []
+    for series in values:
+        if series.x.dtype.kind not in "biuf" or series.y.dtype.kind not in "biuf":
+            return None
+        if series.labels is None:
+            continue
+        valid = ~np.isnan(get_heatmap_values(series.labels))
+        if not np.any(valid):
+            continue
+        _, edges = get_heatmap_cells((series.x if axis == "x" else series.y)[valid])
+        mins.append(edges[0])
+        maxs.append(edges[-1])
+    if len(mins) == 0:
+        return None
+    return float(min(mins)), float(max(maxs))
+
+
+# Color a density grid (see get_density) with the given (r, g, b) color (0 to 255), by varying its opacity
+def get_density_rgba(density, rgb):
+    rgba = np.empty(density.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = rgb
+    # Empty cells are transparent, and the others are at least slightly visible
+    rgba[..., 3] = np.where(density > 0, 40 + density * 215, 0).astype(np.uint8)
+    return rgba
+
+
+# A series to plot (one per value on the Y-axis)
+# Numeric values are stored as contiguous arrays (float64, or float32 if requested). The error arrays are only stored
+# if an error param was given, and are otherwise generated as zeros when accessed
+class Series:
+    __slots__ = ("x", "y", "_x_err", "_y_err", "legend", "position", "visible", "labels", "color", "marker", "dtype")
+
+    def __init__(self, x, y, x_err=None, y_err=None, legend=None, position="default", visible=True, labels=None,
+                 color=None, marker="circle", dtype=np.float64):
+        self.dtype = dtype
+        self.x = self.to_array(x)
+        self.y = self.to_array(y)
+        self._x_err = self.to_array(x_err) if x_err is not None else None
+        self._y_err = self.to_array(y_err) if y_err is not None else None
+        self.legend = legend
+        self.position = position
+        self.visible = visible
+        self.labels = labels
+        self.color = color
+        self.marker = marker
+
+    def to_array(self, values):
+        values = np.asarray(values)
+        # Non-numeric values (e.g. categories on the X-axis) are kept as they are
+        if values.dtype.kind in "biuf":
+            return np.ascontiguousarray(values, dtype=self.dtype)
+        return values
+
+    @property
+    def has_x_err(self):
+        return self._x_err is not None
+
+    @property
+    def has_y_err(self):
+        return self._y_err is not None
+
+    @property
+    def x_err(self):
+        return self._x_err if self._x_err is not None else np.zeros(len(self.x), dtype=self.dtype)
+
+    @property
+    def y_err(self):
+        return self._y_err if self._y_err is not None else np.zeros(len(self.y), dtype=self.dtype)
+
+
 # Get the X and Y axis values to plot
-def get_values(config, root_dir):
+# extracted is the output of extract_param_paths() over (at least) the params of this config. If None, the params are
+# extracted from the results file here
+def get_values(config, root_dir, extracted=None):
+    def get_profiled_param_value(param_path, min_cutoff, max_cutoff):
+        with profiler.stage("get_param_value", detail=param_path) as record:
+            value = get_param_value(param_path, extracted, min_cutoff, max_cutoff)
+            record["points"] = len(value) if hasattr(value, "__len__") else 1
+        return value
+
     def get_axis_values(axis_value_param):
-        axis_values = get_param_value(axis_value_param["param"], results,
-                                      axis_value_param["min_cutoff"],
-                                      axis_value_param["max_cutoff"])
-        axis_values = np.array(axis_values)
-        axis_value_param["scale_by"] = get_scale_by_value(axis_values, axis_value_param["scale_by"])
-        if axis_value_param["scale_by"] != 1:
-            axis_values = axis_values / axis_value_param["scale_by"]
+        axis_values = get_profiled_param_value(axis_value_param["param"],
+                                               axis_value_param["min_cutoff"],
+                                               axis_value_param["max_cutoff"])
+        with profiler.stage("scale", detail=axis_value_param["param"]) as record:
+            axis_values = np.array(axis_values)
+            axis_value_param["scale_by"] = get_scale_by_value(axis_values, axis_value_param["scale_by"])
+            if axis_value_param["scale_by"] != 1:
+                axis_values = axis_values / axis_value_param["scale_by"]
+            record["points"] = len(axis_values)
 
         # Error values
         if axis_value_param["error"] is not None:
-            axis_err_values = get_param_value(axis_value_param["error"], results, None, None)
+            axis_err_values = get_profiled_param_value(axis_value_param["error"], None, None)
             if axis_err_values is not None:
                 axis_err_values = np.array(axis_err_values)
                 if axis_value_param["scale_by"] != 1:
                     axis_err_values = axis_err_values / axis_value_param["scale_by"]
         else:
-            # Set err_values as 0
-            axis_err_values = np.array([0] * len(axis_values))
+            # No errors (generated as zeros by the Series, if needed)
+            axis_err_values = None
 
         return axis_values, axis_err_values
 
-    os.chdir(root_dir)
-    # Read the JSON file
-    with open(config["results_file"], "r") as f:
-        results = json.load(f)
+    profiler.set_plot(config["plot"]["title"])
+    if extracted is None:
+        # Read the JSON file (parsed once per run and shared across configs)
+        results_file = os.path.join(root_dir, config["results_file"])
+        results = results_cache.load(results_file)
+        extracted = extract_param_paths(get_param_paths(config), results, results_file)
 
     # Initialize the parameters
     x_params = config["x_axis"]
     y_params = config["y_axis"]
-    values = []  # Consists of tuples of (x_values, x_err_values, y_values, y_err_values, label, y_position)
+    values = []  # Consists of a Series per Y-axis value
 
     # Check X-axis has either 1 value (in which case we duplicate it for all Y) or the same number of values as Y-axis
     if (len(x_params["values"]) != 1
@@ -119,7 +531,7 @@ def get_values(config, root_dir):
             position = y_value_param["position"]
             # Labels
             if y_value_param["labels"] is not None:
-                labels = get_param_value(y_value_param["labels"], results, None, None)
+                labels = get_profiled_param_value(y_value_param["labels"], None, None)
             # Values
             y_values, y_err_values = get_axis_values(y_value_param)
         else:
@@ -130,17 +542,17 @@ def get_values(config, root_dir):
             # values
             x_values, x_err_values = get_axis_values(x_value_param)
         else:
-            # Generate x_values as index and x_err_values as 0
-            x_values = np.array([i for i in range(1, len(y_values) + 1)])
-            x_err_values = np.array([0] * len(x_values))
+            # Generate x_values as index (without errors)
+            x_values = np.arange(1, len(y_values) + 1)
+            x_err_values = None
 
         # Sort the values by X-axis
-        if len(x_values) != len(x_err_values):
+        if x_err_values is not None and len(x_values) != len(x_err_values):
             warning = (f"Lengths of x_values and x_err_values do not match!"
                        f"Skipping param {x_value_param['param']} from plot {config['plot']['title']}")
             warnings.warn(warning)
             continue
-        if len(y_values) != len(y_err_values):
+        if y_err_values is not None and len(y_values) != len(y_err_values):
             warning = (f"Lengths of y_values and y_err_values do not match!"
                        f"Skipping param {y_value_param['param']} from plot {config['plot']['title']}")
             warnings.warn(warning)
@@ -153,13 +565,15 @@ def get_values(config, root_dir):
                            f"{y_value_param['param']} from plot {config['plot']['title']}")
                 warnings.warn(warning)
                 x_values = np.array([x_values for _ in range(len(y_values))])
-                x_err_values = np.array([x_err_values for _ in range(len(y_values))])
+                if x_err_values is not None:
+                    x_err_values = np.array([x_err_values for _ in range(len(y_values))])
         if len(y_values) == 1 and len(x_values) > 1:
             warning = (f"Duplicating Y-axis values for {x_value_param['param']}, "
                        f"{y_value_param['param']} from plot {config['plot']['title']}")
             warnings.warn(warning)
             y_values = np.array([y_values for _ in range(len(x_values))])
-            y_err_values = np.array([y_err_values for _ in range(len(x_values))])
+            if y_err_values is not None:
+                y_err_values = np.array([y_err_values for _ in range(len(x_values))])
         if labels is None:
             labels = [None] * len(y_values)
         if len(labels) != len(y_values):
@@ -168,22 +582,56 @@ def get_values(config, root_dir):
             warnings.warn(warning)
             labels = [None] * len(y_values)
 
-        # Sort the array
+        # Sort the array (columnar, by X-axis)
         if y_values is not None and len(y_values) > 0 and x_values is not None and len(x_values) > 0 \
-                and not all(isinstance(elem, str) for elem in x_values):
-            combined_array = zip(x_values, x_err_values, y_values, y_err_values, labels)
-            sorted_array = sorted(combined_array, key=lambda x: x[0])
-            x_values, x_err_values, y_values, y_err_values, labels = zip(*sorted_array)
-            x_values = list(x_values)
-            x_err_values = list(x_err_values)
-            y_values = list(y_values)
-            y_err_values = list(y_err_values)
-            labels = list(labels)
+                and x_values.dtype.kind not in "US":
+            record = profiler.start("sort", detail=y_value_param["param"])
             if all(elem is None for elem in labels):
                 labels = None
+            else:
+                labels = np.array(labels, dtype=object)
+            # Extra elements (if the lengths of X and Y axes differ) are dropped
+            length = min(len(x_values), len(y_values))
+            sort_key = x_values[:length].reshape(length, -1)[:, 0]
+            if not np.all(sort_key[1:] >= sort_key[:-1]):
+                order = np.argsort(sort_key, kind="stable")
+            else:
+                order = slice(0, length)
+            x_values = x_values[order]
+            y_values = y_values[order]
+            if x_err_values is not None:
+                x_err_values = x_err_values[order]
+            if y_err_values is not None:
+                y_err_values = y_err_values[order]
+            if labels is not None:
+                labels = labels[order]
+            record["points"] = length
+            profiler.stop(record)
+
+        # Downsample (by X-axis, so after sorting)
+        if y_value_param is not None and y_value_param["downsample"] is not None and y_values is not None \
+                and x_values is not None and y_values.ndim == 1 and x_values.ndim == 1 \
+                and len(x_values) == len(y_values) and y_values.dtype.kind in "biuf":
+            with profiler.stage("downsample", detail=y_value_param["param"]) as record:
+                indices = get_downsample_indices(x_values, y_values, **y_value_param["downsample"])
+                record["points"] = len(y_values)
+            if indices is not None:
+                print(f"Downsampled {y_value_param['param']} from {len(y_values)} to {len(indices)} points "
+                      f"({y_value_param['downsample']['method']})")
+                if legend is not None:
+                    legend = f"{legend} ({len(indices)} of {len(y_values)} points)"
+                x_values = x_values[indices]
+                y_values = y_values[indices]
+                if x_err_values is not None:
+                    x_err_values = x_err_values[indices]
+                if y_err_values is not None:
+                    y_err_values = y_err_values[indices]
+                if labels is not None:
+                    labels = np.asarray(labels, dtype=object)[indices]
 
-        values.append(
-            (x_values, x_err_values, y_values, y_err_values, legend, position, y_value_param["visible"], labels,
-             y_value_param["color"], y_value_param["marker"]))
+        values.append(Series(x_values, y_values, x_err=x_err_values, y_err=y_err_values, legend=legend,
+                             position=position, visible=y_value_param["visible"], labels=labels,
+                             color=y_value_param["color"], marker=y_value_param["marker"],
+                             dtype=np.float32 if config["plot"]["dtype"] == "float32" else np.float64))
 
     return values
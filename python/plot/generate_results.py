@@ -0,0 +1,124 @@
+import argparse
+import json
+
+import numpy as np
+
+# Values are written in chunks, so that large series don't need to be formatted in memory all at once
+CHUNK_SIZE = 100000
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Generate a synthetic results.json (e.g. to benchmark plotting)')
+    parser.add_argument("-o", "--output", default="results.json",
+                        help='(Optional) The results file to write')
+    parser.add_argument("--depth", type=int, default=2,
+                        help='(Optional) The number of nested objects the series are in')
+    parser.add_argument("--series", type=int, default=4,
+                        help='(Optional) The number of series')
+    parser.add_argument("--points", type=int, default=1000,
+                        help='(Optional) The number of points per series')
+    parser.add_argument("--heatmap-points", type=int, default=None,
+                        help='(Optional) The number of cells of the heatmap (default: --points)')
+    parser.add_argument("--no-stats-values", action="store_true",
+                        help='(Optional) Leave the values of the stats empty (as with storeVals=false)')
+    parser.add_argument("--seed", type=int, default=0,
+                        help='(Optional) The seed for the random values')
+    return parser.parse_args()
+
+
+def write_array(f, array, element_format="{}"):
+    f.write("[")
+    for start in range(0, len(array), CHUNK_SIZE):
+        if start > 0:
+            f.write(",")
+        f.write(",".join(element_format.format(*element) if isinstance(element, tuple) else
+                         element_format.format(element) for element in array[start:start + CHUNK_SIZE]))
+    f.write("]")
+
+
+# Write a series in the shape of Stats::to_json() (cpp/src/stats/Stats.h)
+def write_stats(f, values, time_stamps, store_values):
+    # The median is NaN (written as null) if the values are not stored
+    order = np.sort(values)
+    median = float((order[(len(order) - 1) // 2] + order[len(order) // 2]) / 2) if store_values else None
+    stats = {
+        "unit": "nanoseconds",
+        "avg": float(np.mean(values)),
+        "stdev": float(np.std(values)),
+        "median": median,
+        "min": float(np.min(values)),
+        "minIdx": int(np.argmin(values)),
+        "max": float(np.max(values)),
+        "maxIdx": int(np.argmax(values)),
+        "count": len(values),
+    }
+    f.write(json.dumps(stats)[:-1])
+    f.write(', "values": ')
+    if store_values:
+        write_array(f, list(zip(values.tolist(), time_stamps.tolist())), '{{"value": {}, "timeStamp": {}}}')
+    else:
+        f.write("[]")
+    f.write("}")
+
+
+# Generate a results file with the given number of series, nested in depth objects (level_0, level_1, ...):
+# [{"level_0": {"level_1": {"series_0": Stats, ..., "columns": {"series_0": {"value": [], "timeStamp": []}, ...},
+#   "heatmap": {"x": [], "y": [], "value": []}}}}]
+# Stats are as written by Stats::to_json(). As param paths can't select a key across a list of objects (the values of
+# the stats), the values and time stamps are also written as plain arrays under "columns", which are the ones to plot
+# Returns the param path prefix of the innermost object (e.g. "[0].level_0.level_1")
+def generate_results(output, depth=2, series=4, points=1000, store_values=True, seed=0, heatmap_points=None):
+    rng = np.random.default_rng(seed)
+    prefix = "[0]" + "".join(f".level_{level}" for level in range(depth))
+    with open(output, "w") as f:
+        f.write("[")
+        for level in range(depth):
+            f.write(f'{{"level_{level}": ')
+        f.write("{")
+
+        columns = []
+        for i in range(series):
+            # Latency-like values (log-normal), at increasing time stamps (in ns)
+            values = np.round(rng.lognormal(mean=3 + i * 0.1, sigma=0.5, size=points), 3)
+            time_stamps = np.cumsum(rng.integers(1, 1000, size=points))
+            f.write(f'"series_{i}": ')
+            write_stats(f, values, time_stamps, store_values)
+            f.write(", ")
+            columns.append((values, time_stamps))
+
+        f.write('"columns": {')
+        for i, (values, time_stamps) in enumerate(columns):
+            if i > 0:
+                f.write(", ")
+            f.write(f'"series_{i}": {{"value": ')
+            write_array(f, values.tolist())
+            f.write(', "timeStamp": ')
+            write_array(f, time_stamps.tolist())
+            f.write("}")
+        f.write("}, ")
+
+        # A square grid with (about) as many cells as points
+        side = max(int(np.sqrt(points if heatmap_points is None else heatmap_points)), 1)
+        grid_x, grid_y = np.meshgrid(np.arange(side), np.arange(side))
+        f.write('"heatmap": {"x": ')
+        write_array(f, grid_x.ravel().tolist())
+        f.write(', "y": ')
+        write_array(f, grid_y.ravel().tolist())
+        f.write(', "value": ')
+        write_array(f, np.round(rng.random(side * side) * 100, 3).tolist())
+        f.write("}")
+
+        f.write("}" * (depth + 1))
+        f.write("]")
+    return prefix
+
+
+def main():
+    args = parse_arguments()
+    prefix = generate_results(args.output, args.depth, args.series, args.points, not args.no_stats_values, args.seed,
+                              args.heatmap_points)
+    print(f"Generated {args.output}. The series are at {prefix}.columns.series_<i>.value")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,25 @@
+import math
 import os
 import warnings
 
+import matplotlib
 import numpy as np
 import progressbar
 from matplotlib import pyplot as plt
 from matplotlib import ticker
+from matplotlib.collections import PathCollection
+from matplotlib.colors import to_rgb, ListedColormap
 from matplotlib.lines import Line2D
 from matplotlib.ticker import PercentFormatter
 
+from data_preprocessor import get_density, get_density_rgba, get_heatmap_values, get_heatmap_grid, \
+    get_heatmap_limits, get_axis_limits, HEATMAP_PALETTE
+from output_paths import get_output_file_name, get_output_files, get_matplotlib_formats
+from profiler import profiler
+
+# The plots are only written to file, so the non-interactive backend is used (no display or GUI event loop needed)
+matplotlib.use("Agg")
+
 colors = {
     "red": "#e60049",
     "purple": "#9b19f5",
@@ -22,80 +34,110 @@ colors = {
 
 
 class Matplotlib:
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, executor=None, reuse_figures=False):
         # Hard-coded plot params
         self.title_font_size = 20
         self.label_font_size = 20
         self.tick_font_size = 18  # Also sets the font size of the scientific notation (offset, exponent)
         self.px = 1 / plt.rcParams['figure.dpi']
-        self.plot_dimension = (1800 * self.px, 500 * self.px)
+        self.plot_dimension = (1800, 500)  # In pixels, as the dimensions in the config
         self.grid_columns = 2
         self.root_dir = root_dir
 
         # Variable plot params
         self.groups = {}
 
-    def write_to_file(self, plot, config=None, group=None):
+        # Figures kept to draw the next plots of the same shape into, if reuse_figures (see get_template_key)
+        self.reuse_figures = reuse_figures
+        self.templates = {}
+
+        # Thread pool to write the plots to file in the background (writes are done inline if None)
+        self.executor = executor
+        self.pending_writes = []
+
+    def get_output_file_name(self, config=None, group=None):
+        return get_output_file_name(self.root_dir, config, group)
+
+    def get_output_files(self, output_formats, config=None, group=None):
+        return get_output_files(self.root_dir, get_matplotlib_formats(output_formats), config, group)
+
+    # The figure is closed once written, unless it is kept to be reused
+    def write_to_file(self, plot, output_formats, config=None, group=None, close=True):
         # Write to file
         if config is None and group is None:
             warnings.warn("Either config or group should be present when writing to file!")
-        output_path = ""
-        if group is not None:
-            output_path, group = str(group).split(":")
-        if config is None:
-            config = {
-                "results_file": "results.json",
-                "output_path": output_path,
-                "plot": {
-                    "title": str(group)
-                },
-                "output_file": "plot"
-            }
-        os.chdir(self.root_dir)
-        plot_dir = os.path.abspath(os.path.join(config["results_file"], os.pardir, "plots",
-                                                config["output_path"]))
-        if not os.path.exists(plot_dir):
-            os.makedirs(plot_dir)
-        os.chdir(plot_dir)
-        plot.savefig(f'{config["output_file"]}.png' if group is None else f'{str(group)}.png')
+        output_file_name, _ = self.get_output_file_name(config, group)
+        os.makedirs(os.path.dirname(output_file_name), exist_ok=True)
+        title = config["plot"]["title"] if group is None else str(group).split(":")[-1]
+        for output_format in get_matplotlib_formats(output_formats):
+            with profiler.stage("write", plot=title, detail=f"{output_file_name}.{output_format}") as record:
+                plot.savefig(f"{output_file_name}.{output_format}")
+                record["bytes"] = os.path.getsize(f"{output_file_name}.{output_format}")
+        if close:
+            plt.close(plot)
+
+    # Returns the future of the write (None if written inline)
+    def submit_write(self, *args, **kwargs):
+        # Writing in the background lets the write overlap with rendering the next plot
+        if self.executor is None:
+            self.write_to_file(*args, **kwargs)
+            return None
+        write = self.executor.submit(self.write_to_file, *args, **kwargs)
+        self.pending_writes.append(write)
+        return write
+
+    def wait_for_writes(self):
+        pending_writes, self.pending_writes = self.pending_writes, []
+        for write in pending_writes:
+            # Raises the exception of the write, if any
+            write.result()
 
+    # Write a group (e.g. once its last member is plotted), and release its members
+    def write_group(self, group):
+        if group not in self.groups:
+            return
+        members, output_formats = self.groups.pop(group)
+        # Every member is drawn into its own cell of the grid, as large as the largest member
+        columns = min(len(members), self.grid_columns)
+        rows = math.ceil(len(members) / columns)
+        width = max(self.get_figsize(config)[0] for config, _ in members)
+        height = max(self.get_figsize(config)[1] for config, _ in members)
+        fig, axs = plt.subplots(rows, columns, figsize=(width * columns, height * rows), squeeze=False)
+        axs = axs.flatten()
+        for i, (config, values) in enumerate(members):
+            self.plot(config, values, ax=axs[i])
+        for ax in axs[len(members):]:
+            ax.set_axis_off()
+        fig.tight_layout()
+        self.submit_write(fig, output_formats, group=group)
+
+    # Write the groups which are left (all of them, unless written by write_group() already)
     def write_group_plots(self):
         if len(self.groups) == 0:
+            self.wait_for_writes()
             return
         print("Writing group plots to file...")
         progress_bar = progressbar.ProgressBar(max_value=len(self.groups))
-        progress = 0
-        for group, plots in self.groups.items():
-            rows = len(plots) // self.grid_columns
-            figs, axs = plt.subplots(rows, self.grid_columns, figsize=(
-                self.plot_dimension[0] * self.grid_columns, self.plot_dimension[1] * rows))
-            axs.flatten()
-            for i, fig in enumerate(plots):
-                # Render figure onto grid
-                fig.canvas.draw()
-                axs[i].imshow(fig.canvas.buffer_rgba())
-            self.write_to_file(figs, group=group)
-            progress += 1
-            progress_bar.update(progress)
+        for progress, group in enumerate(list(self.groups)):
+            self.write_group(group)
+            progress_bar.update(progress + 1)
         progress_bar.finish()
+        self.wait_for_writes()
 
     @staticmethod
-    def plot_by_type(fig, config, values, ax1, ax2):
+    def plot_by_type(config, values, ax1, ax2):
         plot_type = config["plot"]["type"]
         color_list = list(colors)
         elems = []
-        for i in range(0, len(values)):
-            value = values[i]
-            x_axis_values = value[0]
-            x_axis_err = value[1]
-            y_axis_values = value[2]
-            y_axis_err = value[3]
-            legend = value[4]
-            position = value[5]
-            # visible = value[6]
-            # labels = value[7]
-            color = value[8]
-            color = color if color is not None else colors[color_list[i % len(color_list)]]
+        for i, series in enumerate(values):
+            x_axis_values = series.x
+            # Errors are only passed if the series has them
+            x_axis_err = series.x_err if series.has_x_err else None
+            y_axis_values = series.y
+            y_axis_err = series.y_err if series.has_y_err else None
+            legend = series.legend
+            position = series.position
+            color = series.color if series.color is not None else colors[color_list[i % len(color_list)]]
 
             if plot_type == "line":
                 if x_axis_values is None:
@@ -110,13 +152,27 @@ class Matplotlib:
                                           color=color,
                                           xerr=x_axis_err, yerr=y_axis_err, ecolor=colors["black"], capsize=5)
 
+            elif plot_type == "scatter" and config["plot"]["scatter"]["density"] is not None \
+                    and x_axis_values is not None and x_axis_values.dtype.kind in "biuf":
+                density = get_density(x_axis_values, y_axis_values, **config["plot"]["scatter"]["density"])
+                if density is None:
+                    continue
+                density, x_edges, y_edges, outliers = density
+                ax = ax2 if position == "right" else ax1
+                rgba = get_density_rgba(density, tuple(int(channel * 255) for channel in to_rgb(color)))
+                ax.imshow(rgba, origin="lower", extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]),
+                          aspect="auto", interpolation="nearest")
+                if outliers is not None and len(outliers) > 0:
+                    ax.scatter(x_axis_values[outliers], y_axis_values[outliers], color=color, s=4)
+                # The image has no legend handle of its own
+                elems.append(Line2D([], [], color=color, marker="s", linestyle=""))
             elif plot_type == "scatter":
                 dot_size = 10
                 if x_axis_values is not None:
                     if position == "right":
-                        ax2.scatter(x_axis_values, y_axis_values, label=legend, color=color, s=dot_size)
+                        elems.append(ax2.scatter(x_axis_values, y_axis_values, label=legend, color=color, s=dot_size))
                     else:
-                        ax1.scatter(x_axis_values, y_axis_values, label=legend, color=color, s=dot_size)
+                        elems.append(ax1.scatter(x_axis_values, y_axis_values, label=legend, color=color, s=dot_size))
                 else:
                     if position == "right":
                         ax2.scatter(y_axis_values, label=legend, color=color, s=dot_size)
@@ -139,36 +195,107 @@ class Matplotlib:
                     config["x_axis"]["ticks"] = bins
                 yticks = [0, 0.2, 0.4, 0.6, 0.8, 1]
                 config["y_axis"]["ticks"] = [tick * len(data) for tick in yticks]
-                ax1.ylim(0, len(data))
-                fig.gca().yaxis.set_major_formatter(PercentFormatter(xmax=len(data)))
+                ax1.set_ylim(0, len(data))
+                ax1.yaxis.set_major_formatter(PercentFormatter(xmax=len(data)))
+            elif plot_type == "heatmap":
+                if series.labels is None:
+                    print("Heatmap requires labels for y axes")
+                    return -1
+                heatmap_values = get_heatmap_values(series.labels)
+                if np.all(np.isnan(heatmap_values)):
+                    return -1
+                x_edges, y_edges, grid = get_heatmap_grid(x_axis_values, y_axis_values, heatmap_values)
+                ax1.pcolormesh(x_edges, y_edges, np.ma.masked_invalid(grid), cmap=ListedColormap(HEATMAP_PALETTE),
+                               vmin=np.nanmin(heatmap_values), vmax=np.nanmax(heatmap_values))
             else:
                 warnings.warn(f"Invalid plot type, skipping plot with title {config['plot']['title']}")
                 return -1
         return elems
 
-    # Plot the values based on the x_axis_values and y_axis_values
-    def plot(self, config, values):
-        # Plot size
-
+    # The size of the plot (in inches)
+    def get_figsize(self, config):
         x_dim = config["plot"]["dimensions"][0]
         x_dim = x_dim if x_dim is not None else self.plot_dimension[0]
         y_dim = config["plot"]["dimensions"][1]
         y_dim = y_dim if y_dim is not None else self.plot_dimension[1]
-        fig, ax = plt.subplots(figsize=(x_dim * self.px, y_dim * self.px))
+        return x_dim * self.px, y_dim * self.px
 
-        ax1 = ax
-        ax2 = None
-        if any(value[5] == "right" for value in values):
-            ax2 = ax1.twinx()
+    # Plots with the same key can be drawn into the figure of a previous one, by swapping the data of its artists
+    # Only line and scatter plots (without errors or density) have a key, as they have one artist per series
+    def get_template_key(self, config, values):
+        plot_type = config["plot"]["type"]
+        if not self.reuse_figures or plot_type not in ["line", "scatter"] \
+                or (plot_type == "scatter" and config["plot"]["scatter"]["density"] is not None):
+            return None
+        if any(series.x is None or series.x.dtype.kind not in "biuf" or series.has_x_err or series.has_y_err
+               for series in values):
+            return None
+        x_params = config["x_axis"]
+        y_params = config["y_axis"]
+        return (self.get_figsize(config), plot_type, tuple(series.position for series in values),
+                x_params["plot_scale"], y_params["plot_scale"], x_params["ticks"] is None,
+                y_params["tick_labels"] is None, y_params["tick_labels_right"] is None)
 
-        # Plot the values
-        elems = self.plot_by_type(fig, config, values, ax1, ax2)
-        if elems == -1:
-            return -1
-        elems = [elem for elem in elems if isinstance(elem, Line2D)]
+    # Swap the data of the artists of a figure (one per series) for the values of the next plot
+    @staticmethod
+    def swap_values(elems, values):
+        color_list = list(colors)
+        for i, (elem, series) in enumerate(zip(elems, values)):
+            color = series.color if series.color is not None else colors[color_list[i % len(color_list)]]
+            if isinstance(elem, Line2D):
+                elem.set_data(series.x, series.y)
+                elem.set_markerfacecolor(color)
+                elem.set_markeredgecolor(color)
+            else:
+                elem.set_offsets(np.column_stack((series.x, series.y)))
+            elem.set_color(color)
+            elem.set_label(series.legend)
+
+    # Plot the values based on the x_axis_values and y_axis_values
+    # The plot is drawn into ax if given (e.g. a cell of the grid of a group), else into a figure of its own which is
+    # written to file. Plots in a group are kept until write_group_plots(), which draws them all into one grid
+    def plot(self, config, values, ax=None):
+        if ax is None and config["plot"]["group"] is not None:
+            if config["plot"]["group"] not in self.groups:
+                self.groups[config["plot"]["group"]] = ([], config["plot"]["output_format"])
+            self.groups[config["plot"]["group"]][0].append((config, values))
+            return
+
+        record = profiler.start("render", plot=config["plot"]["title"])
+        record["points"] = sum(len(series.y) for series in values)
+
+        fig = None
+        template_key = self.get_template_key(config, values) if ax is None else None
+        template = self.templates.get(template_key) if template_key is not None else None
+        if template is not None:
+            # The last plot drawn into the figure has to be written before it is drawn over
+            if template["write"] is not None:
+                template["write"].result()
+            fig, ax, ax2, elems = template["fig"], template["ax1"], template["ax2"], template["elems"]
+            ax1 = ax
+            self.swap_values(elems, values)
+        else:
+            if ax is None:
+                fig, ax = plt.subplots(figsize=self.get_figsize(config))
+
+            ax1 = ax
+            ax2 = None
+            if any(series.position == "right" for series in values):
+                ax2 = ax1.twinx()
+
+            # Plot the values
+            elems = self.plot_by_type(config, values, ax1, ax2)
+            if elems == -1:
+                if fig is not None:
+                    plt.close(fig)
+                return -1
+            elems = [elem for elem in elems if isinstance(elem, (Line2D, PathCollection))]
+            if template_key is not None:
+                template = {"fig": fig, "ax1": ax1, "ax2": ax2, "elems": elems, "write": None}
+                self.templates[template_key] = template
 
         # Legend
-        legends = [value[4] for value in values]
+        legends = [series.legend for series in values]
         ax.legend(elems, legends, loc=0)
 
         # Axis labels and titles
@@ -183,11 +310,25 @@ class Matplotlib:
 
         # Axis scale
         if x_params["plot_scale"] == "log":
-            ax.xscale("log")
-            fig.gca().xaxis.set_major_formatter(ticker.ScalarFormatter())
+            ax.set_xscale("log")
+            ax.xaxis.set_major_formatter(ticker.ScalarFormatter())
         if y_params["plot_scale"] == "log":
-            ax.yscale("log")
-            fig.gca().yaxis.set_major_formatter(ticker.ScalarFormatter())
+            ax1.set_yscale("log")
+            ax1.yaxis.set_major_formatter(ticker.ScalarFormatter())
+
+        # Axis limits (min, max with 10% padding, or the edges of the cells for heatmaps), the same as the Bokeh plots
+        if config["plot"]["type"] != "histogram":
+            get_limits = get_heatmap_limits if config["plot"]["type"] == "heatmap" else get_axis_limits
+            x_limits = get_limits(values, "x")
+            if x_limits is not None:
+                ax.set_xlim(*x_limits)
+            y_limits = get_limits([series for series in values if series.position == "default"], "y")
+            if y_limits is not None:
+                ax1.set_ylim(*y_limits)
+            if ax2 is not None:
+                y_limits = get_limits([series for series in values if series.position == "right"], "y")
+                if y_limits is not None:
+                    ax2.set_ylim(*y_limits)
 
         # Plot ticks
         if x_params["ticks"] is not None:
@@ -202,11 +343,10 @@ class Matplotlib:
                                fontsize=self.tick_font_size)
             else:
                 ax2.tick_params(axis='y', labelsize=self.tick_font_size)
-        fig.gca().xaxis.offsetText.set_fontsize(self.tick_font_size)
+        ax.xaxis.offsetText.set_fontsize(self.tick_font_size)
+        profiler.stop(record)
 
-        if config["plot"]["group"] is not None:
-            if config["plot"]["group"] not in self.groups:
-                self.groups[config["plot"]["group"]] = []
-            self.groups[config["plot"]["group"]].append(fig)
-        else:
-            self.write_to_file(fig, config=config)
+        if template is not None:
+            template["write"] = self.submit_write(fig, config["plot"]["output_format"], config=config, close=False)
+        elif fig is not None:
+            self.submit_write(fig, config["plot"]["output_format"], config=config)
@@ -0,0 +1,44 @@
+import os
+
+OUTPUT_FORMATS = ["html", "svg", "png", "pdf", "dashboard"]
+# The formats each renderer can write. The first one is used if none of the output formats are among them
+BOKEH_FORMATS = ["html", "svg", "png", "dashboard"]
+MATPLOTLIB_FORMATS = ["png", "svg", "pdf"]
+RENDERER_FORMATS = {"bokeh": BOKEH_FORMATS, "matplotlib": MATPLOTLIB_FORMATS}
+
+
+# Get the output file name (without extension) and the directory of the plots of either a config or a group.
+# Kept apart from the renderers, so that the outputs of a config can be found without importing a plotting library
+def get_output_file_name(root_dir, config=None, group=None):
+    output_path = ""
+    # Discard output path from group
+    if group is not None:
+        output_path, group = str(group).split(":")
+
+    if config is None:
+        config = {
+            "results_file": "results.json",
+            "output_path": output_path,
+            "output_file": "plot"
+        }
+    # Relative paths are relative to the root dir (absolute results files are kept as they are)
+    plots_parent_dir = os.path.abspath(os.path.join(root_dir, config["results_file"], os.pardir))
+    plot_dir = os.path.join(plots_parent_dir, "plots", config["output_path"])
+    return os.path.join(plot_dir, f'{config["output_file"]}' if group is None else f'{str(group)}'), \
+        plots_parent_dir
+
+
+def get_matplotlib_formats(output_formats):
+    return [output_format for output_format in output_formats if output_format in MATPLOTLIB_FORMATS] or ["png"]
+
+
+# The file written for an output format. A dashboard is an index page, with a directory of a script per plot next to it
+def get_output_file(output_file_name, output_format):
+    if output_format == "dashboard":
+        return f"{output_file_name}_dashboard.html"
+    return f"{output_file_name}.{output_format if output_format in OUTPUT_FORMATS else 'html'}"
+
+
+def get_output_files(root_dir, output_formats, config=None, group=None):
+    output_file_name, _ = get_output_file_name(root_dir, config, group)
+    return [get_output_file(output_file_name, output_format) for output_format in output_formats]
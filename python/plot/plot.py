@@ -1,19 +1,69 @@
 import argparse
+import copy
+import importlib
 import json
+import multiprocessing.util
 import numbers
 import os
 import subprocess
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
-import progressbar
-from bokeh.models import AdaptiveTicker
-from bokeh.core.enums import MarkerType
-
-from bokeh_wrapper import Bokeh
-from data_preprocessor import get_values
-from matplotlib_wrapper import Matplotlib
+from build_manifest import BuildManifest
+from data_preprocessor import get_values, get_param_paths, extract_param_paths, stream_param_paths, \
+    compile_param_path, DOWNSAMPLE_METHODS
+from output_paths import get_output_file_name, get_output_files, OUTPUT_FORMATS, RENDERER_FORMATS
+from profiler import profiler
+from results_cache import results_cache, DEFAULT_BUDGET_MB
 
 MAX_VISIBLE = 5
+DEFAULT_DENSITY_BINS = 200
+
+import_times = {}  # module -> time (in seconds) taken to import it
+
+
+# Import a module on first use (plotting libraries take a while to import), and record how long it took
+def timed_import(module_name):
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if module_name not in import_times:
+        import_times[module_name] = time.perf_counter() - start
+    return module
+
+
+# Imports a renderer (and its plotting library) and creates it on first use, so that only the plotting libraries of the
+# renderers in use are imported
+class LazyRenderer:
+    def __init__(self, module_name, class_name, *args, **kwargs):
+        self.module_name = module_name
+        self.class_name = class_name
+        self.args = args
+        self.kwargs = kwargs
+        self.renderer = None
+
+    def get(self):
+        if self.renderer is None:
+            module = timed_import(self.module_name)
+            self.renderer = getattr(module, self.class_name)(*self.args, **self.kwargs)
+        return self.renderer
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    # Nothing to write or close if the renderer was never used
+    def write_group(self, group):
+        if self.renderer is not None:
+            self.renderer.write_group(group)
+
+    def write_group_plots(self):
+        if self.renderer is not None:
+            self.renderer.write_group_plots()
+
+    def close_webdrivers(self):
+        if self.renderer is not None:
+            self.renderer.close_webdrivers()
 
 
 def execute_program(command):
@@ -35,12 +85,44 @@ def parse_arguments():
                         help='The configuration file for the plot')
     parser.add_argument("-d", "--dir", default=None,
                         help='(Optional) The directory relative to which the paths are in the plot_config')
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_BUDGET_MB,
+                        help='(Optional) Memory budget (in MB, estimated as 6x the size of the results files) for '
+                             'caching parsed results files')
+    parser.add_argument("--stream", action="store_true",
+                        help='(Optional) Stream the results files instead of loading them in memory. '
+                             'Only the plotted params are kept in memory. Requires ijson')
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help='(Optional) The number of processes to plot with. Plots are rendered serially if 1')
+    parser.add_argument("--threads", type=int, default=0,
+                        help='(Optional) The number of threads to write plots to file with (in the background). '
+                             'Plots are written inline if 0')
+    parser.add_argument("-f", "--force", action="store_true",
+                        help='(Optional) Plot all the configs, even the ones which are up-to-date')
+    parser.add_argument("--reuse-figures", action="store_true",
+                        help='(Optional) Draw matplotlib line and scatter plots of the same shape into one figure, '
+                             'instead of a new figure per plot')
+    parser.add_argument("--webdrivers", type=int, default=1,
+                        help='(Optional) The number of headless browsers to use for bokeh png/svg exports')
+    parser.add_argument("--timing", action="store_true",
+                        help='(Optional) Report the time taken to import the plotting libraries and to plot')
+    parser.add_argument("--profile", default=None,
+                        help='(Optional) Time each stage of every plot, and save the report to this file (CSV if it '
+                             'ends with .csv, else JSON)')
+    parser.add_argument("--watch", action="store_true",
+                        help='(Optional) Keep running, and re-plot the configs of a results file when it changes')
+    parser.add_argument("--watch-interval", type=float, default=1,
+                        help='(Optional) The interval (in seconds) at which the results files are checked for changes')
+    parser.add_argument("--debounce", type=float, default=2,
+                        help='(Optional) The time (in seconds) a changed results file must stay unchanged before it '
+                             'is re-plotted')
 
     # Return the params
     return parser.parse_args()
 
 
-def check_config(config):
+# With validate_only, the values which need a plotting library (the bokeh markers and tickers) are left as they are, so
+# that configs can be checked (e.g. to find their output files) without importing it
+def check_config(config, validate_only=False):
     def check_results_file():
         if ("results_file" not in config or config["results_file"] == '' or config["results_file"] is None
                 or not isinstance(config["results_file"], str)):
@@ -64,20 +146,24 @@ def check_config(config):
         if "plot" not in config or config["plot"] is None or not isinstance(config["plot"], dict):
             warnings.warn("Missing parameter: plot")
             return -1
+        if ("renderer" not in plot_params or plot_params["renderer"] == '' or plot_params["renderer"] is None
+                or not isinstance(plot_params["renderer"], str)):
+            plot_params["renderer"] = "bokeh"
+        # Keep the output formats the renderer can write
+        renderer_formats = RENDERER_FORMATS.get(plot_params["renderer"], OUTPUT_FORMATS)
         if "output_format" not in config["plot"]:
-            config["plot"]["output_format"] = ["html"]
+            config["plot"]["output_format"] = [renderer_formats[0]]
         if isinstance(config["plot"]["output_format"], str):
-            if config["plot"]["output_format"] not in ["html", "png", "svg"]:
-                config["plot"]["output_format"] = ["html"]
-            else:
-                config["plot"]["output_format"] = [config["plot"]["output_format"]]
+            config["plot"]["output_format"] = [config["plot"]["output_format"]]
         if isinstance(config["plot"]["output_format"], list):
             output_formats = []
             for elem in config["plot"]["output_format"]:
-                if elem in ["html", "png", "svg"]:
+                if elem in renderer_formats:
                     output_formats.append(elem)
+                elif elem in OUTPUT_FORMATS:
+                    warnings.warn(f"{plot_params['renderer']} can't write {elem} plots. Skipping that output format")
             if len(output_formats) == 0:
-                config["plot"]["output_format"] = "html"
+                config["plot"]["output_format"] = [renderer_formats[0]]
             else:
                 config["plot"]["output_format"] = output_formats
         if "dimensions" not in config["plot"] or len(config["plot"]["dimensions"]) != 2:
@@ -92,9 +178,6 @@ def check_config(config):
                     warnings.warn(": (colon) is not allowed in group name. Replacing it with _")
                     plot_params["group"] = plot_params["group"].replace(":", "_")
                 plot_params["group"] = config["output_path"] + ":" + plot_params["group"]
-        if ("renderer" not in plot_params or plot_params["renderer"] == '' or plot_params["renderer"] is None
-                or not isinstance(plot_params["renderer"], str)):
-            plot_params["renderer"] = "bokeh"
         if "type" not in plot_params or plot_params["type"] == '' or plot_params["type"] is None:
             warnings.warn("Missing required parameter: plot: type")
             return -1
@@ -103,6 +186,8 @@ def check_config(config):
             return -1
         if "notes" not in plot_params or not isinstance(plot_params["notes"], str):
             plot_params["notes"] = None
+        if "dtype" not in plot_params or plot_params["dtype"] not in ["float64", "float32"]:
+            plot_params["dtype"] = "float64"
         # Check for plot-type specific parameters
         # Histogram
         if plot_params["type"] == "histogram":
@@ -123,6 +208,52 @@ def check_config(config):
             if ("scatter" not in plot_params or plot_params["scatter"] is None
                     or not isinstance(plot_params["scatter"], dict)):
                 plot_params["scatter"] = {}
+            plot_params["scatter"]["density"] = check_density(plot_params["scatter"].get("density"))
+
+        plot_params["downsample"] = check_downsample(plot_params.get("downsample"))
+
+    def check_density(density):
+        if density is True:
+            density = {}
+        if not isinstance(density, dict):
+            return None
+        bins = density.get("bins")
+        if isinstance(bins, numbers.Number) and bins >= 1:
+            bins = [int(bins), int(bins)]
+        elif not (isinstance(bins, list) and len(bins) == 2
+                  and all(isinstance(b, numbers.Number) and b >= 1 for b in bins)):
+            bins = [DEFAULT_DENSITY_BINS, DEFAULT_DENSITY_BINS]
+        scale = density.get("scale") if density.get("scale") in ["log", "linear"] else "log"
+        outliers = density.get("outliers")
+        if not isinstance(outliers, numbers.Number) or not 50 < outliers < 100:
+            if outliers is not None:
+                warnings.warn("scatter: density: outliers must be a percentile between 50 and 100. Ignoring it")
+            outliers = None
+        return {"bins": [int(b) for b in bins], "scale": scale, "outliers": outliers}
+
+    def check_downsample(downsample):
+        # Only line and scatter plots are downsampled (except density scatter plots, which use all the points)
+        if plot_params["type"] not in ["line", "scatter"] or not isinstance(downsample, dict):
+            return None
+        if plot_params["type"] == "scatter" and plot_params["scatter"]["density"] is not None:
+            return None
+        if ("target_points" not in downsample or not isinstance(downsample["target_points"], numbers.Number)
+                or downsample["target_points"] < 3):
+            warnings.warn(f"downsample: target_points must be a number (at least 3). Not downsampling config with "
+                          f"results file {config['results_file']}")
+            return None
+        if "method" not in downsample or downsample["method"] not in DOWNSAMPLE_METHODS:
+            downsample["method"] = "lttb"
+        return {"target_points": int(downsample["target_points"]), "method": downsample["method"]}
+
+    def check_param_path(param_path):
+        # Compile the path here, so that malformed paths are reported before any results file is read
+        try:
+            compile_param_path(param_path)
+        except ValueError as e:
+            warnings.warn(f"{e}. Ignoring it for config with results file {config['results_file']}")
+            return False
+        return True
 
     def check_axis(axis):
         if "values" in axis:
@@ -131,6 +262,8 @@ def check_config(config):
                 if ("param" not in value or value["param"] == '' or value["param"] is None
                         or not isinstance(value["param"], str)):
                     items_to_delete.append(value)
+                elif not check_param_path(value["param"]):
+                    items_to_delete.append(value)
             axis["values"] = [value for value in axis["values"] if value not in items_to_delete]
         else:
             axis["values"] = []
@@ -143,6 +276,8 @@ def check_config(config):
             for value in axis["values"]:
                 if "error" not in value or value["error"] == '' or not isinstance(value["error"], str):
                     value["error"] = None
+                if value["error"] is not None and not check_param_path(value["error"]):
+                    value["error"] = None
                 if "legend" not in value or not isinstance(value["legend"], str | None) or value["legend"] in legend_map:
                     value["legend"] = value["param"]
                     if value["legend"] in legend_map and value["legend"] is not None:
@@ -154,8 +289,11 @@ def check_config(config):
                     legend_map[value["legend"]] = 1
                 if "color" not in value or not isinstance(value["color"], str):
                     value["color"] = None
-                if "marker" not in value or not isinstance(value["marker"], str) or value["marker"] not in list(
-                        MarkerType):
+                if "marker" not in value or not isinstance(value["marker"], str):
+                    value["marker"] = "circle"
+                # Markers are only drawn by bokeh
+                if config["plot"]["renderer"] == "bokeh" and not validate_only and value["marker"] not in list(
+                        timed_import("bokeh.core.enums").MarkerType):
                     value["marker"] = "circle"
                 if "scale_by" not in value or not isinstance(value["scale_by"], (numbers.Number, str)):
                     value["scale_by"] = 1
@@ -188,6 +326,13 @@ def check_config(config):
                 # They are unused in the other plot types
                 if "labels" not in value or not isinstance(value["labels"], (str, list)):
                     value["labels"] = None
+                if isinstance(value["labels"], str) and not check_param_path(value["labels"]):
+                    value["labels"] = None
+                # The downsampling of the plot, unless set for this value (null to not downsample this value)
+                if "downsample" in value:
+                    value["downsample"] = check_downsample(value["downsample"])
+                else:
+                    value["downsample"] = plot_params["downsample"]
 
         # Check for optional parameters
         if "label" not in axis or axis["label"] is None or not isinstance(axis["label"], str):
@@ -239,8 +384,8 @@ def check_config(config):
                     axis["tick_labels"] = temp
         else:
             # Only necessary for right Y-axis due to how it is instantiated
-            if config["plot"]["renderer"] == "bokeh":
-                axis["ticks_right"] = AdaptiveTicker()
+            if config["plot"]["renderer"] == "bokeh" and not validate_only:
+                axis["ticks_right"] = timed_import("bokeh.models").AdaptiveTicker()
                 axis["tick_labels_right"] = {}
 
     if check_results_file() == -1:
@@ -292,43 +437,375 @@ def check_config(config):
         config["output_file"] = plot_params["title"].replace(" ", "_")
 
 
-def main():
-    global root_dir
-
-    args = parse_arguments()
-    if args.dir is not None:
-        global root_dir
-        root_dir = args.dir
-    with open(args.configs, "r") as f:
-        configs = json.load(f)
+def render(config, values, bkh, mpl):
+    if config["plot"]["renderer"] == "bokeh":
+        bkh.plot(config, values)
+    elif config["plot"]["renderer"] == "matplotlib":
+        mpl.plot(config, values)
+    else:
+        warnings.warn("Specified Renderer not supported. Must be either 'bokeh' or 'matplotlib' "
+                      f"for config with results file {config['results_file']}, ignoring this config")
+
+
+# Count the members of each group (by renderer) of the checked configs
+def get_group_sizes(configs):
+    group_sizes = {}
+    for config in configs:
+        if config["plot"]["group"] is not None:
+            key = (config["plot"]["renderer"], config["plot"]["group"])
+            group_sizes[key] = group_sizes.get(key, 0) + 1
+    return group_sizes
+
+
+# Called once a config is done with (plotted or skipped). The group of the config is written (and released) as soon as
+# its last member is done, so that only the groups being plotted are kept in memory, and the group is written while
+# the next configs are plotted (with --threads)
+def finish_group_member(config, group_sizes, bkh, mpl):
+    if config["plot"]["group"] is None:
+        return
+    key = (config["plot"]["renderer"], config["plot"]["group"])
+    group_sizes[key] -= 1
+    if group_sizes[key] > 0:
+        return
+    if config["plot"]["renderer"] == "bokeh":
+        bkh.write_group(config["plot"]["group"])
+    elif config["plot"]["renderer"] == "matplotlib":
+        mpl.write_group(config["plot"]["group"])
+
+
+def plot_serial(configs, args, bkh, mpl):
+    # Check all the configs first, so that the params of every config using a results file are known upfront
+    checked_configs = []
+    for config in configs:
+        if check_config(config) == -1:
+            warnings.warn("Skipping plot...")
+            continue
+        checked_configs.append(config)
+    group_sizes = get_group_sizes(checked_configs)
+
+    # Group the params by results file. Each results file is walked only once to extract the params of all the
+    # configs using it, and the extracted params are dropped once its last config is plotted. The parsed results file
+    # is not cached, as it is not needed after the walk (so only one is in memory at a time)
+    param_paths = {}
+    remaining_configs = {}
+    for config in checked_configs:
+        param_paths.setdefault(config["results_file"], set()).update(get_param_paths(config))
+        remaining_configs[config["results_file"]] = remaining_configs.get(config["results_file"], 0) + 1
+    extracted = {}
+
+    progress_bar = timed_import("progressbar").ProgressBar(max_value=len(checked_configs), redirect_stdout=True,
+                                                           redirect_stderr=True)
+
+    for idx, config in enumerate(checked_configs):
+        print(f"\nStarting plot {config['plot']['title']} and results file {config['results_file']}")
+        results_file = config["results_file"]
+        if results_file not in extracted:
+            if args.stream:
+                extracted[results_file] = stream_param_paths(param_paths[results_file], results_file)
+            else:
+                extracted[results_file] = extract_param_paths(param_paths[results_file],
+                                                              results_cache.load(results_file, cache=False),
+                                                              results_file)
+        # Get the values to plot
+        values = get_values(config, root_dir, extracted[results_file])
+        remaining_configs[results_file] -= 1
+        if remaining_configs[results_file] == 0:
+            del extracted[results_file]
+        if values is not None and len(values) > 0:
+            render(config, values, bkh, mpl)
+            progress_bar.update(idx + 1)
+        finish_group_member(config, group_sizes, bkh, mpl)
 
-    bkh = Bokeh(root_dir)
-    mpl = Matplotlib(root_dir)
+    progress_bar.finish()
 
-    progress_bar = progressbar.ProgressBar(max_value=len(configs), redirect_stdout=True, redirect_stderr=True)
 
-    for idx, config in enumerate(configs):
-        print(f"\nStarting plot {config['plot']['title']} and results file {config['results_file']}")
-        if check_config(config) == -1:
+# State of a worker process (when plotting in parallel)
+worker_renderers = None
+worker_stream = False
+
+
+def init_worker(worker_root_dir, cache_size, stream, webdrivers, reuse_figures, profile):
+    global root_dir, worker_renderers, worker_stream
+    root_dir = worker_root_dir
+    results_cache.set_budget(cache_size)
+    profiler.enabled = profile
+    worker_renderers = (LazyRenderer("bokeh_wrapper", "Bokeh", root_dir, webdrivers=webdrivers),
+                        LazyRenderer("matplotlib_wrapper", "Matplotlib", root_dir, reuse_figures=reuse_figures))
+    # Worker processes don't run atexit handlers, so close the browsers of this worker when it exits
+    multiprocessing.util.Finalize(None, worker_renderers[0].close_webdrivers, exitpriority=10)
+    worker_stream = stream
+
+
+# Returns the values of the grouped configs (None for the others), and the profile records of the configs. When
+# streaming, the configs share a results file, which is streamed once for all of them
+def plot_in_worker(configs):
+    checked = [check_config(config) != -1 for config in configs]
+    extracted = None
+    if worker_stream and any(checked):
+        param_paths = set()
+        for config, is_checked in zip(configs, checked):
+            if is_checked:
+                param_paths.update(get_param_paths(config))
+        extracted = stream_param_paths(param_paths, configs[checked.index(True)]["results_file"])
+
+    grouped_values = []
+    for config, is_checked in zip(configs, checked):
+        grouped_values.append(None)
+        if not is_checked:
             warnings.warn("Skipping plot...")
             continue
-        # Get the values to plot
-        values = get_values(config, root_dir)
+        print(f"\nStarting plot {config['plot']['title']} and results file {config['results_file']}")
+        values = get_values(config, root_dir, extracted)
         if values is None or len(values) == 0:
             continue
-        if config["plot"]["renderer"] == "bokeh":
-            bkh.plot(config, values)
-        elif config["plot"]["renderer"] == "matplotlib":
-            mpl.plot(config, values)
+        # Grouped plots are rendered by the parent (in the order of the configs), as the group is written as a whole
+        if config["plot"]["group"] is not None:
+            grouped_values[-1] = values
+            continue
+        render(config, values, *worker_renderers)
+    return grouped_values, profiler.take_records()
+
+
+# Returns the configs which are left to plot (serially): all of them if the worker processes can't be started, or the
+# ones which are not done if a worker process died
+def plot_parallel(configs, args, bkh, mpl):
+    # The group members are checked here too, as they are rendered by this process. Each config is a task, except when
+    # streaming, where the configs of a results file are one task, so that the results file is streamed only once
+    checked_configs = {}
+    tasks = []
+    stream_tasks = {}  # results file -> task
+    for idx, config in enumerate(configs):
+        checked_config = copy.deepcopy(config)
+        with warnings.catch_warnings():
+            # Reported by the worker
+            warnings.simplefilter("ignore")
+            if check_config(checked_config) == -1:
+                tasks.append([idx])
+                continue
+        if checked_config["plot"]["group"] is not None:
+            checked_configs[idx] = checked_config
+        if not args.stream:
+            tasks.append([idx])
+        elif checked_config["results_file"] in stream_tasks:
+            stream_tasks[checked_config["results_file"]].append(idx)
         else:
-            warnings.warn("Specified Renderer not supported. Must be either 'bokeh' or 'matplotlib' "
-                          f"for config with results file {config['results_file']}, ignoring this config")
-        progress_bar.update(idx + 1)
+            stream_tasks[checked_config["results_file"]] = [idx]
+            tasks.append(stream_tasks[checked_config["results_file"]])
+    group_sizes = get_group_sizes(checked_configs.values())
+    # The group members are rendered in the order of the configs, as soon as all the members before them are done
+    members = sorted(checked_configs)
+    next_member = 0
+    done = set()
+    grouped_values = {}
+    try:
+        pool = ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker,
+                                   initargs=(root_dir, args.cache_size, args.stream, args.webdrivers,
+                                             args.reuse_figures, profiler.enabled))
+        # The configs are sent (pickled) as they are, so the configs of this process stay unchecked
+        futures = {pool.submit(plot_in_worker, [configs[idx] for idx in task]): task for task in tasks}
+    except (OSError, NotImplementedError, BrokenProcessPool) as e:
+        # Nothing was rendered by this process yet
+        warnings.warn(f"Could not plot in parallel ({e}). Falling back to plotting serially")
+        return configs
+
+    with pool:
+        progress_bar = timed_import("progressbar").ProgressBar(max_value=len(configs), redirect_stdout=True,
+                                                               redirect_stderr=True)
+        try:
+            for future in as_completed(futures):
+                task_values, records = future.result()
+                profiler.add_records(records)
+                for idx, values in zip(futures[future], task_values):
+                    if values is not None:
+                        grouped_values[idx] = values
+                    done.add(idx)
+                while next_member < len(members) and members[next_member] in done:
+                    config = checked_configs[members[next_member]]
+                    values = grouped_values.pop(members[next_member], None)
+                    if values is not None:
+                        render(config, values, bkh, mpl)
+                    finish_group_member(config, group_sizes, bkh, mpl)
+                    next_member += 1
+                progress_bar.update(len(done))
+        except BrokenProcessPool as e:
+            # The group members which are not rendered yet are left too (even if done by a worker), so that the rest of
+            # every group is rendered in order, after the members already in it
+            warnings.warn(f"A worker process died ({e}). Plotting the configs which are not done serially")
+            left = {idx for idx in range(len(configs)) if idx not in done} | set(members[next_member:])
+            return [configs[idx] for idx in sorted(left)]
+        finally:
+            progress_bar.finish()
+    return []
+
+
+def get_build_entries(configs, manifest):
+    # Check copies of the configs (the configs are checked again when they are plotted) to find their output files and
+    # their build manifest entries. The configs of a group share the entry of the group, so that the group is
+    # rebuilt if any of its members changed
+    entries = {}  # config index -> (plots parent dir, output files, entry)
+    groups = {}  # (renderer, group) -> [(config index, checked config)]
+    for idx, config in enumerate(configs):
+        config = copy.deepcopy(config)
+        with warnings.catch_warnings():
+            # Reported when the config is plotted
+            warnings.simplefilter("ignore")
+            if check_config(config, validate_only=True) == -1:
+                continue
+        renderer = config["plot"]["renderer"]
+        if renderer not in ["bokeh", "matplotlib"]:
+            continue
+        if config["plot"]["group"] is not None:
+            groups.setdefault((renderer, config["plot"]["group"]), []).append((idx, config))
+            continue
+        output_files = get_output_files(root_dir, config["plot"]["output_format"], config=config)
+        _, plots_parent_dir = get_output_file_name(root_dir, config=config)
+        entries[idx] = (plots_parent_dir, output_files, manifest.get_entry(plots_parent_dir, [config]))
+
+    for (renderer, group), members in groups.items():
+        member_configs = [config for _, config in members]
+        # The output formats of the first member of the group are used
+        output_files = get_output_files(root_dir, member_configs[0]["plot"]["output_format"], group=group)
+        _, plots_parent_dir = get_output_file_name(root_dir, group=group)
+        entry = manifest.get_entry(plots_parent_dir, member_configs)
+        for idx, _ in members:
+            entries[idx] = (plots_parent_dir, output_files, entry)
+    return entries
+
+
+def build(configs, args, bkh, mpl):
+    # Skip the plots which are up-to-date with their config and results files
+    manifest = BuildManifest()
+    build_start = time.time()
+    entries = get_build_entries(configs, manifest)
+    outdated = [idx for idx in range(len(configs))
+                if args.force or idx not in entries or not manifest.is_up_to_date(*entries[idx])]
+    if len(outdated) < len(configs):
+        print(f"Skipping {len(configs) - len(outdated)} up-to-date plot(s). Use --force to plot them anyway")
+    # The configs are checked (modified) when plotted, so plot copies of them (they are plotted again in watch mode)
+    configs = [copy.deepcopy(configs[idx]) for idx in outdated]
+
+    if len(configs) == 0:
+        # Nothing to plot (creating a progress bar alone can take a while, as it probes the terminal)
+        pass
+    elif args.jobs > 1:
+        configs_left = plot_parallel(configs, args, bkh, mpl)
+        if len(configs_left) > 0:
+            plot_serial(configs_left, args, bkh, mpl)
+    else:
+        plot_serial(configs, args, bkh, mpl)
 
-    progress_bar.finish()
     bkh.write_group_plots()
     mpl.write_group_plots()
 
+    # Record the plots which were written in this run. The up-to-date plots are recorded again too, as their results
+    # files may have been touched (with the same content), so that the new mtimes let the next runs skip hashing them
+    outdated = set(outdated)
+    for idx, (plots_parent_dir, output_files, entry) in entries.items():
+        if idx not in outdated or all(os.path.exists(output_file) and os.path.getmtime(output_file) >= build_start
+                                      for output_file in output_files):
+            manifest.record(plots_parent_dir, output_files, entry)
+    manifest.save()
+
+
+def get_results_file_dependents(configs):
+    # Map each results file to the indices of the configs plotted from it, including the other members of their
+    # groups (a group is always plotted as a whole)
+    checked_configs = []
+    group_members = {}  # (renderer, group) -> [config index]
+    for idx, config in enumerate(configs):
+        config = copy.deepcopy(config)
+        with warnings.catch_warnings():
+            # Reported when the config is plotted
+            warnings.simplefilter("ignore")
+            if check_config(config, validate_only=True) == -1:
+                continue
+        checked_configs.append((idx, config))
+        if config["plot"]["group"] is not None:
+            group_members.setdefault((config["plot"]["renderer"], config["plot"]["group"]), []).append(idx)
+
+    dependents = {}  # results file -> {config index}
+    for idx, config in checked_configs:
+        members = group_members.get((config["plot"]["renderer"], config["plot"]["group"]), [idx])
+        dependents.setdefault(config["results_file"], set()).update(members)
+    return dependents
+
+
+def get_file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watch(configs, args, bkh, mpl):
+    # The configs and the renderers (and their write threads) are kept across re-plots. The results files are parsed
+    # again for every re-plot (they aren't cached when plotting serially, and the worker processes are new every time)
+    dependents = get_results_file_dependents(configs)
+    last_stats = {results_file: get_file_stat(results_file) for results_file in dependents}
+    changed = {}  # results file -> time of its last change
+    print(f"Watching {len(dependents)} results file(s) for changes. Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            now = time.monotonic()
+            for results_file in dependents:
+                stat = get_file_stat(results_file)
+                if stat != last_stats[results_file]:
+                    last_stats[results_file] = stat
+                    changed[results_file] = now
+
+            # Wait for a changed file to settle (e.g. while it is still being written) before re-plotting it
+            settled = [results_file for results_file, changed_at in changed.items()
+                       if now - changed_at >= args.debounce and last_stats[results_file] is not None]
+            if len(settled) == 0:
+                continue
+            affected = set()
+            for results_file in settled:
+                del changed[results_file]
+                affected.update(dependents[results_file])
+            print(f"{', '.join(settled)} changed. Re-plotting {len(affected)} config(s)")
+            build([configs[idx] for idx in sorted(affected)], args, bkh, mpl)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def main():
+    global root_dir
+
+    start = time.perf_counter()
+    args = parse_arguments()
+    if args.dir is not None:
+        global root_dir
+        root_dir = args.dir
+    with open(args.configs, "r") as f:
+        configs = json.load(f)
+    results_cache.set_budget(args.cache_size)
+    profiler.enabled = args.profile is not None
+
+    executor = ThreadPoolExecutor(max_workers=args.threads) if args.threads > 0 else None
+    bkh = LazyRenderer("bokeh_wrapper", "Bokeh", root_dir, executor, args.webdrivers)
+    mpl = LazyRenderer("matplotlib_wrapper", "Matplotlib", root_dir, executor, args.reuse_figures)
+
+    build(configs, args, bkh, mpl)
+    if args.watch:
+        watch(configs, args, bkh, mpl)
+
+    if executor is not None:
+        executor.shutdown()
+    results_cache.print_stats()
+    if args.profile is not None:
+        profiler.print_stats()
+        profiler.save(args.profile)
+        print(f"Profile saved to {args.profile}")
+    if args.timing:
+        total_time = time.perf_counter() - start
+        import_time = sum(import_times.values())
+        print(f"Timing: {total_time:.2f} s in total, {import_time:.2f} s importing, "
+              f"{total_time - import_time:.2f} s plotting")
+        for module, seconds in import_times.items():
+            print(f"  import {module}: {seconds:.2f} s")
+
 
 if __name__ == "__main__":
     # Set the working directory
@@ -0,0 +1,79 @@
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+PROFILE_FIELDS = ["plot", "detail", "seconds", "points", "bytes"]
+
+
+# Times the stages of plotting (load, extract, get_param_value, scale, sort, render, write) of every plot, along with
+# the number of points and bytes handled by each stage
+# Each record is {"stage", "plot", "detail", "seconds", "points", "bytes"}. Nothing is recorded unless enabled
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.plot = ""  # The plot whose values are being read (stages without an explicit plot are attributed to it)
+        self.records = []
+
+    def set_plot(self, plot):
+        self.plot = plot
+
+    def start(self, stage, plot=None, detail=""):
+        return {
+            "stage": stage,
+            "plot": self.plot if plot is None else str(plot),
+            "detail": detail,
+            "seconds": time.perf_counter(),
+            "points": 0,
+            "bytes": 0
+        }
+
+    def stop(self, record):
+        record["seconds"] = time.perf_counter() - record["seconds"]
+        if self.enabled:
+            # Appending is atomic, so plots written by other threads can be recorded too
+            self.records.append(record)
+
+    # Time the enclosed block. The points and bytes can be set on the yielded record
+    @contextmanager
+    def stage(self, stage, plot=None, detail=""):
+        record = self.start(stage, plot, detail)
+        yield record
+        self.stop(record)
+
+    # Get (and forget) the records so far, e.g. to send them from a worker process to the main process
+    def take_records(self):
+        records = self.records
+        self.records = []
+        return records
+
+    def add_records(self, records):
+        self.records.extend(records)
+
+    def print_stats(self):
+        totals = {}
+        for record in self.records:
+            totals[record["stage"]] = totals.get(record["stage"], 0) + record["seconds"]
+        print(f"Profile: {', '.join(f'{stage} {seconds:.2f} s' for stage, seconds in totals.items())}")
+
+    # Save as CSV (one row per record) if the file ends with .csv, else as JSON
+    # The JSON has a list per field for each stage (e.g. {"render": {"plot": [...], "seconds": [...], ...}}), so that
+    # it can be plotted with param paths like "render.seconds"
+    def save(self, profile_file):
+        if profile_file.endswith(".csv"):
+            with open(profile_file, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=["stage"] + PROFILE_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.records)
+            return
+        stages = {}
+        for record in self.records:
+            stage = stages.setdefault(record["stage"], {field: [] for field in PROFILE_FIELDS})
+            for field in PROFILE_FIELDS:
+                stage[field].append(record[field])
+        with open(profile_file, "w") as f:
+            json.dump(stages, f, indent=2)
+
+
+# Shared profiler for the whole run
+profiler = Profiler()
@@ -0,0 +1,89 @@
+import json
+import os
+from collections import OrderedDict
+
+from profiler import profiler
+
+DEFAULT_BUDGET_MB = 1024
+# A parsed results file (dicts, lists and floats) takes about this many times the size of the file on disk in memory
+PARSED_SIZE_FACTOR = 6
+
+
+class ResultsCache:
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        # The budget is accounted in the estimated size of the parsed results (see get_parsed_size), as measuring the
+        # size of the parsed object would need a walk over the whole tree
+        self.budget = budget_mb * 1024 * 1024
+        self.used = 0
+        self.entries = OrderedDict()  # (abs_path, mtime, size) -> parsed results, least recently used first
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_key(results_file):
+        path = os.path.abspath(results_file)
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def get_parsed_size(key):
+        return key[2] * PARSED_SIZE_FACTOR
+
+    def set_budget(self, budget_mb):
+        self.budget = budget_mb * 1024 * 1024
+        self.evict()
+
+    def evict(self, keep=None):
+        # Evict the least recently used entries until we are under the budget, but never the one we just added
+        while self.used > self.budget and len(self.entries) > 0:
+            key = next(iter(self.entries))
+            if key == keep:
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(key)
+                continue
+            del self.entries[key]
+            self.used -= self.get_parsed_size(key)
+            self.evictions += 1
+
+    # Without cache, the results are returned from the cache if there, but not added to it (e.g. if they are only used
+    # once, so that they can be freed as soon as they are done with)
+    def load(self, results_file, cache=True):
+        key = self.get_key(results_file)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        # Drop stale entries of the same file (it was modified since it was cached)
+        for stale_key in [k for k in self.entries if k[0] == key[0]]:
+            del self.entries[stale_key]
+            self.used -= self.get_parsed_size(stale_key)
+        with profiler.stage("load", plot="", detail=key[0]) as record:
+            with open(key[0], "r") as f:
+                results = json.load(f)
+            record["bytes"] = key[2]
+        if not cache:
+            return results
+        self.entries[key] = results
+        self.used += self.get_parsed_size(key)
+        self.evict(keep=key)
+        return results
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total > 0 else 0
+        print(f"Results cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+              f"{self.evictions} evictions, {len(self.entries)} files ({self.used / (1024 * 1024):.1f} MB) cached")
+
+
+# Shared cache for the whole run
+results_cache = ResultsCache()